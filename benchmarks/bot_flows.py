@@ -0,0 +1,216 @@
+"""End-to-end benchmark of the real dispatcher against a fake Bot API.
+
+Feeds synthetic updates through `main.dp` (all middlewares and handlers)
+while the bot talks to the local fake Bot API server and to a local mongod
+(or mongomock-motor with --mongomock). Each simulated user runs
+
+    /start -> CategoryWise -> National -> English -> <count> -> answers every poll -> /leaderboard
+
+concurrently with the others, then the admin sends /broadcast to everyone.
+Reports updates per second, per-handler latency percentiles, MongoDB
+commands per quiz (mongod only), Bot API calls and peak RSS. --output saves
+the results as JSON and --baseline prints them next to an earlier run.
+
+baseline_mongomock.json holds a reference run (50 users, 5 questions,
+mongomock-motor, aiogram 3.31).
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bot_flows.py --users 50 --questions 5
+    python benchmarks/bot_flows.py --mongomock --baseline benchmarks/baseline_mongomock.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import time
+
+from fake_telegram import FakeTelegramServer
+
+PORT = 8083
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{PORT}"
+# Measure the bot, not Telegram's flood limits (see send_throughput.py for those).
+os.environ.setdefault("SEND_GLOBAL_RATE", "100000")
+os.environ.setdefault("SEND_CHAT_RATE", "100000")
+os.environ.setdefault("SEND_CHAT_BURST", "1000")
+os.environ.setdefault("BROADCAST_RATE", "100000")
+
+from common import CommandCounter, main, seed_questions, use_benchmark_database  # noqa: E402
+
+# Per-request access and update logs would dominate the run time.
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+update_ids = itertools.count(1)
+message_ids = itertools.count(1)
+
+
+def user_payload(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+
+def message_update(user_id: int, text: str) -> dict:
+    message = {
+        "message_id": next(message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user_payload(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(update_ids), "message": message}
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    return {"update_id": next(update_ids), "callback_query": {
+        "id": str(next(message_ids)),
+        "from": user_payload(user_id),
+        "chat_instance": str(user_id),
+        "data": data,
+        "message": {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "text": "Choose an option:",
+        },
+    }}
+
+
+def poll_answer_update(user_id: int, poll_id: str, option: int) -> dict:
+    return {"update_id": next(update_ids), "poll_answer": {
+        "poll_id": poll_id, "user": user_payload(user_id), "option_ids": [option],
+        "option_persistent_ids": [str(option)],  # Required by newer Bot API versions, ignored by older aiogram
+    }}
+
+
+class Driver:
+    """Feed updates into the dispatcher and record end-to-end latency."""
+
+    def __init__(self):
+        self.latencies = []
+
+    async def feed(self, data: dict):
+        update = main.types.Update.model_validate(data, context={"bot": main.bot})
+        started = time.perf_counter()
+        await main.dp.feed_update(main.bot, update)
+        self.latencies.append(time.perf_counter() - started)
+
+
+async def quiz_flow(driver: Driver, server: FakeTelegramServer, user_id: int, questions: int):
+    await driver.feed(message_update(user_id, "/start"))
+    await driver.feed(callback_update(user_id, "CategoryWise"))
+    await driver.feed(callback_update(user_id, "National"))
+    await driver.feed(callback_update(user_id, "English"))
+    await driver.feed(message_update(user_id, str(questions)))
+    polls = [poll_id for poll_id, chat_id in list(server.polls.items()) if chat_id == user_id]
+    for n, poll_id in enumerate(polls):
+        await driver.feed(poll_answer_update(user_id, poll_id, n % 4))
+    await driver.feed(message_update(user_id, "/leaderboard"))
+
+
+async def wait_for_broadcast(timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await main.broadcasts_collection.find_one({"status": "completed"}, {"_id": 1}):
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def run(users: int, questions: int, pool: int, use_mongomock: bool):
+    server = FakeTelegramServer(global_rate=100000, chat_rate=100000, chat_burst=1000, port=PORT)
+    await server.start()
+
+    counter = CommandCounter()
+    client = None
+    if use_mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    db = use_benchmark_database(counter, client)
+    for name in ("users", "quotas", "user_sessions", "fsm_states", "poll_tracking", "broadcasts", "results"):
+        await db[name].drop()
+    await seed_questions(db, "national", pool)
+    await main.leaderboards.rebuild()
+
+    driver = Driver()
+    counter.reset()
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(quiz_flow(driver, server, 500000 + n, questions) for n in range(users)))
+        quiz_elapsed = time.monotonic() - started
+        quiz_commands = counter.total()
+
+        await driver.feed(message_update(main.ADMIN_ID, "/broadcast Benchmark broadcast"))
+        broadcast_done = await wait_for_broadcast()
+        elapsed = time.monotonic() - started
+    finally:
+        await main.bot.session.close()
+        await server.stop()
+
+    handlers = {
+        name: {
+            "count": histogram.count,
+            "p50_ms": round(histogram.percentile(0.5) * 1000, 2),
+            "p95_ms": round(histogram.percentile(0.95) * 1000, 2),
+            "p99_ms": round(histogram.percentile(0.99) * 1000, 2),
+        }
+        for (kind, name), histogram in sorted(main.metrics.histograms.items()) if kind == "handler"
+    }
+    return {
+        "users": users,
+        "questions": questions,
+        "mongo": "mongomock" if use_mongomock else "mongod",
+        "updates": len(driver.latencies),
+        "updates_per_s": round(len(driver.latencies) / quiz_elapsed, 1),
+        "update_p50_ms": round(percentile(driver.latencies, 0.5) * 1000, 2),
+        "update_p95_ms": round(percentile(driver.latencies, 0.95) * 1000, 2),
+        "update_p99_ms": round(percentile(driver.latencies, 0.99) * 1000, 2),
+        "mongo_commands_per_quiz": None if use_mongomock else round(quiz_commands / users, 1),
+        "broadcast_completed": broadcast_done,
+        "elapsed_s": round(elapsed, 2),
+        "bot_api": server.report()["accepted"],
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "handlers": handlers,
+    }
+
+
+def print_results(results: dict, baseline: dict | None):
+    for key, value in results.items():
+        if key == "handlers":
+            continue
+        previous = baseline.get(key) if baseline else None
+        suffix = f"   (baseline {previous})" if previous is not None and not isinstance(value, dict) else ""
+        print(f"{key:<26} {value}{suffix}")
+
+    print(f"\n{'handler':<28} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in results["handlers"].items():
+        print(f"{name[:28]:<28} {stats['count']:>6} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--pool", type=int, default=2000)
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of MONGO_URI")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.users, args.questions, args.pool, args.mongomock))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,150 @@
+"""Shared helpers for the offline benchmarks.
+
+The benchmarks import the real handlers from `main.py` and point them at a
+local mongod (MONGO_URI, default mongodb://localhost:27017) using a throwaway
+database, so nothing here touches production data.
+"""
+import os
+import sys
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+# main.py validates the token when it builds the Bot; any well-formed value works offline.
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:offline-benchmark-token")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+import bson
+from pymongo import monitoring
+
+import main
+
+BENCH_DATABASE = "prepbot_benchmark"
+LANGUAGES = ("en", "hi", "gu")
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Count MongoDB commands (round trips) and reply bytes by command name and by collection."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.by_collection = Counter()
+        self.bytes_received = Counter()
+
+    def started(self, event):
+        self.counts[event.command_name] += 1
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            self.by_collection[collection] += 1
+
+    def succeeded(self, event):
+        self.bytes_received[event.command_name] += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        self.counts.clear()
+        self.by_collection.clear()
+        self.bytes_received.clear()
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def use_benchmark_database(counter: CommandCounter, client=None):
+    """Rebind main's MongoDB handles to a counted client on the benchmark database.
+
+    Pass `client` to use a stand-in such as mongomock-motor; it emits no
+    command events, so `counter` stays empty.
+    """
+    if client is None:
+        client = AsyncIOMotorClient(os.environ["MONGO_URI"], event_listeners=[counter, main.mongo_timer])
+    db = client[BENCH_DATABASE]
+    main.client = client
+    main.db = db
+    main.users_collection = db["users"]
+    main.polls_collection = db["polls"]
+    main.quotas_collection = db["quotas"]
+    main.broadcasts_collection = db["broadcasts"]
+    main.update_offset.collection = db["bot_state"]
+    main.question_bank.collection = db["polls"]
+    main.poll_tracker.collection = db["poll_tracking"]
+    main.quiz_timeouts.collection = db["user_sessions"]
+    if main.session_buffer:
+        main.session_buffer.collection = db["user_sessions"]
+    if isinstance(main.fsm_storage, main.MongoStorage):
+        main.fsm_storage.collection = db["fsm_states"]
+    return db
+
+
+async def seed_questions(db, category="national", count=2000):
+    """Insert synthetic multilingual questions into an empty polls collection."""
+    await db["polls"].drop()
+    documents = []
+    for i in range(count):
+        documents.append({
+            "category": category,
+            "year": 2024,
+            "month": 1 + i % 12,
+            "day": 1 + i % 28,
+            "languages": {
+                lang: {
+                    "question": f"[{lang}] Question {i}: " + "lorem ipsum " * 8,
+                    "options": [f"[{lang}] Option {n} " + "dolor " * 4 for n in range(4)],
+                    "explanation": f"[{lang}] Explanation {i}: " + "sit amet " * 30,
+                }
+                for lang in LANGUAGES
+            },
+            "correct_answers": {lang: i % 4 for lang in LANGUAGES},
+        })
+    await db["polls"].insert_many(documents)
+
+
+class FakeBot:
+    """Minimal stand-in for aiogram's Bot that records outgoing calls."""
+
+    def __init__(self):
+        self.calls = Counter()
+
+    async def send_poll(self, **kwargs):
+        self.calls["send_poll"] += 1
+        return SimpleNamespace(poll=SimpleNamespace(id=uuid.uuid4().hex))
+
+    async def send_message(self, *args, **kwargs):
+        self.calls["send_message"] += 1
+
+
+def fake_message(user_id: int, text: str = ""):
+    """Build a message-like object accepted by send_quiz and the handlers it calls."""
+    async def reply(*args, **kwargs):
+        return None
+
+    user = SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Bench")
+    return SimpleNamespace(
+        from_user=user, chat=SimpleNamespace(id=user_id), text=text,
+        answer=reply, reply=reply
+    )
+
+
+class FakeState:
+    """In-memory stand-in for FSMContext with preset data."""
+
+    def __init__(self, **data):
+        self.data = dict(data)
+        self.state = None
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def update_data(self, **data):
+        self.data.update(data)
+        return dict(self.data)
+
+    async def set_state(self, state=None):
+        self.state = state
+
+    async def clear(self):
+        self.data, self.state = {}, None
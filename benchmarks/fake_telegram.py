@@ -0,0 +1,168 @@
+"""Local fake Bot API server that enforces Telegram's flood limits.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:8081. Calls that
+exceed the per-chat or global rate get a 429 with `retry_after`, exactly like
+the real API, so throttling and retry logic can be exercised offline.
+
+Usage:
+    python benchmarks/fake_telegram.py --port 8081 --global-rate 30 --chat-rate 1
+"""
+import argparse
+import itertools
+import json
+import math
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class Bucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_take(self):
+        """Take a token, or return the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeTelegramServer:
+    """aiohttp application emulating the subset of the Bot API the bot uses."""
+
+    SEND_PREFIXES = ("send", "copy", "forward")
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, host="127.0.0.1", port=8081):
+        self.global_bucket = Bucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.host = host
+        self.port = port
+        self.accepted = Counter()
+        self.rejected = Counter()
+        self.polls = {}  # poll_id -> chat_id, for generating poll answers
+        self.message_ids = itertools.count(1)
+        self.poll_ids = itertools.count(1)
+        self.first_call = None
+        self.last_call = None
+        self.runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def _throttle(self, method, chat_id):
+        wait = self.global_bucket.try_take()
+        if not wait and chat_id is not None and method.startswith(self.SEND_PREFIXES):
+            bucket = self.chat_buckets.setdefault(chat_id, Bucket(self.chat_rate, self.chat_burst))
+            wait = bucket.try_take()
+        return wait
+
+    def _message(self, chat_id, **extra):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **extra,
+        }
+
+    def _result(self, method, params):
+        chat_id = int(params["chat_id"]) if str(params.get("chat_id", "")).lstrip("-").isdigit() else 0
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        if method == "getChatMember":
+            user_id = int(params["user_id"])
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": "Bench"}}
+        if method == "sendPoll":
+            poll_id = str(next(self.poll_ids))
+            self.polls[poll_id] = chat_id
+            options = json.loads(params["options"])
+            return self._message(chat_id, poll={
+                "id": poll_id,
+                "question": params["question"],
+                "options": [
+                    {
+                        "persistent_id": str(n),
+                        "text": option if isinstance(option, str) else option.get("text", ""),
+                        "voter_count": 0,
+                    }
+                    for n, option in enumerate(options)
+                ],
+                "total_voter_count": 0,
+                "is_closed": False,
+                "is_anonymous": False,
+                "type": "quiz",
+                "allows_multiple_answers": False,
+                "allows_revoting": False,
+                "members_only": False,
+                "correct_option_id": int(params.get("correct_option_id", 0)),
+            })
+        if method.startswith(self.SEND_PREFIXES):
+            return self._message(chat_id, text=params.get("text") or params.get("caption") or "")
+        return True
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await request.post()
+        chat_id = params.get("chat_id")
+
+        wait = self._throttle(method, chat_id)
+        if wait:
+            retry_after = max(1, math.ceil(wait))
+            self.rejected[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status=429)
+
+        now = time.monotonic()
+        self.first_call = self.first_call or now
+        self.last_call = now
+        self.accepted[method] += 1
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def report(self):
+        elapsed = (self.last_call - self.first_call) if self.first_call and self.last_call else 0.0
+        accepted = sum(self.accepted.values())
+        return {
+            "accepted": dict(self.accepted),
+            "rejected_429": dict(self.rejected),
+            "elapsed_s": round(elapsed, 2),
+            "accepted_per_s": round(accepted / elapsed, 2) if elapsed else None,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--chat-burst", type=int, default=3)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(args.global_rate, args.chat_rate, args.chat_burst, args.host, args.port)
+    web.run_app(server.app, host=args.host, port=args.port)
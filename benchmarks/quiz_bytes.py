@@ -0,0 +1,101 @@
+"""Measure MongoDB reply bytes transferred for one full quiz.
+
+The "legacy" row replays the original whole-document reads (user documents
+on every entitlement/quota check and /result, unprojected question sampling,
+a find_one per sent poll and full session documents on every answer). The
+"current" row runs the real handlers, whose reads are projected to the
+fields each access path uses.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/quiz_bytes.py --questions 15
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from common import CommandCounter, FakeBot, fake_message, main, seed_questions, use_benchmark_database
+
+USER_ID = 1
+
+
+async def seed_user(db):
+    """Insert a user carrying the fields that accumulate in production documents."""
+    await db["users"].delete_many({"user_id": USER_ID})
+    await db["user_sessions"].delete_many({"user_id": USER_ID})
+    await db["users"].insert_one({
+        "user_id": USER_ID,
+        "username": "bench",
+        "last_active_date": str(datetime.now().date()),
+        "correct_answers_today": [f"poll-{n}" for n in range(30)],
+        "daily_score": 12, "monthly_score": 140, "total_score": 900,
+        "last_result": {"user_id": USER_ID, "score": 9, "total_questions": 15,
+                        "correct_answers": 9, "date": datetime.now()},
+        "unlimited_access": True, "unlimited_access_expiry": datetime(2099, 1, 1),
+    })
+
+
+async def legacy_quiz(db, category, count, language):
+    """Replay the pre-projection reads of one quiz request, its answers and /result."""
+    users, polls, sessions = db["users"], db["polls"], db["user_sessions"]
+    for _ in range(3):
+        await users.find_one({"user_id": USER_ID})  # Entitlement and quota checks
+    questions = await polls.aggregate([
+        {"$match": {"category": category}}, {"$sample": {"size": count}}
+    ]).to_list(length=count)
+    await sessions.update_one(
+        {"user_id": USER_ID},
+        {"$set": {"question_ids": [q["_id"] for q in questions], "sent": count, "answered": 0}},
+        upsert=True
+    )
+    for question in questions:
+        await polls.find_one({"_id": question["_id"]})  # send_poll
+    for question in questions:
+        await sessions.find_one_and_update(
+            {"user_id": USER_ID}, {"$inc": {"answered": 1}, "$addToSet": {"correct_questions": question["_id"]}}
+        )
+    await users.find_one({"user_id": USER_ID})  # /result
+
+
+async def current_quiz(category, count, language):
+    """Run one quiz and /result through the real main.py functions."""
+    main.entitlement_cache.invalidate(USER_ID)
+    unlimited = await main.has_valid_unlimited_access(USER_ID)
+    await main.consume_question_quota(USER_ID, count, hourly=unlimited)
+    questions = await main.fetch_questions_by_category(category, count, language)
+    await main.send_quiz(fake_message(USER_ID), questions, count, language)
+    for poll_id in list(main.poll_tracker.entries):
+        poll_answer = SimpleNamespace(user=SimpleNamespace(id=USER_ID), poll_id=poll_id, option_ids=[0])
+        await main.handle_poll_answer(poll_answer)
+    await main.show_result(fake_message(USER_ID, "/result"))
+
+
+async def measure(counter, label, coroutine):
+    counter.reset()
+    await coroutine
+    received = sum(counter.bytes_received.values())
+    print(f"{label:<10} {received:>9} bytes  {counter.total():>4} round trips  {dict(counter.bytes_received)}")
+
+
+async def run(questions: int, pool: int, language: str):
+    counter = CommandCounter()
+    db = use_benchmark_database(counter)
+    main.bot = FakeBot()
+    await seed_questions(db, "national", pool)
+
+    await seed_user(db)
+    await measure(counter, "legacy", legacy_quiz(db, "national", questions, language))
+    await seed_user(db)
+    await measure(counter, "current", current_quiz("national", questions, language))
+
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()  # Quiz timeout timers are irrelevant here
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=15)
+    parser.add_argument("--pool", type=int, default=2000)
+    parser.add_argument("--language", default="en")
+    args = parser.parse_args()
+    asyncio.run(run(args.questions, args.pool, args.language))
@@ -0,0 +1,63 @@
+"""Count MongoDB round trips needed to select and send one quiz.
+
+Compares the original read pattern (load the whole pool, then one find_one
+per question) with the current send pipeline, cold and with a warm question
+bank cache.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/quiz_round_trips.py --questions 15
+"""
+import argparse
+import asyncio
+import random
+
+from common import CommandCounter, FakeBot, fake_message, main, seed_questions, use_benchmark_database
+
+
+async def legacy_quiz_reads(db, category, count, language):
+    """Replay the pre-optimization reads of process_question_count/send_quiz."""
+    pool = await db["polls"].find({"category": category}).to_list(length=None)
+    selected = random.sample(pool, min(count, len(pool)))
+    await db["user_sessions"].update_one(
+        {"user_id": 1}, {"$set": {"question_ids": [q["_id"] for q in selected]}}, upsert=True
+    )
+    for question in selected:
+        await db["polls"].find_one({"_id": question["_id"]})
+
+
+async def current_quiz(category, count, language):
+    """Select and send a quiz through the real main.py functions."""
+    questions = await main.fetch_questions_by_category(category, count, language)
+    await main.send_quiz(fake_message(1), questions, count, language)
+
+
+async def measure(counter, label, coroutine):
+    counter.reset()
+    await coroutine
+    print(f"{label:<28} {counter.total():>4} round trips  {dict(counter.counts)}")
+
+
+async def run(questions: int, pool: int):
+    counter = CommandCounter()
+    db = use_benchmark_database(counter)
+    main.bot = FakeBot()
+    await seed_questions(db, "national", pool)
+
+    await measure(counter, "legacy", legacy_quiz_reads(db, "national", questions, "en"))
+    await measure(counter, "current ($sample)", current_quiz("national", questions, "en"))
+
+    await main.question_bank.load()
+    await measure(counter, "current (bank, cold LRU)", current_quiz("national", questions, "en"))
+    await main.question_bank.get_many(list(main.question_bank.locations))  # Warm the LRU
+    await measure(counter, "current (bank, warm LRU)", current_quiz("national", questions, "en"))
+
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()  # Quiz timeout timers are irrelevant here
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=15)
+    parser.add_argument("--pool", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.questions, args.pool))
@@ -0,0 +1,82 @@
+"""Count user and quota round trips per quiz request in process_question_count.
+
+The "legacy" rows replay the reads and writes of the original helper
+chain (has_valid_unlimited_access, get_user_daily_questions,
+can_request_more_questions, update_hourly_request_count,
+update_user_daily_questions); the "current" rows run the real handler, whose
+entitlement check is cached and whose quota check-and-spend is one
+operation on the `quotas` collection.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/quota_round_trips.py
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from common import (
+    CommandCounter, FakeBot, FakeState, fake_message, main, seed_questions, use_benchmark_database
+)
+
+
+async def legacy_request(users, user_id, count):
+    """Replay the original per-request user reads and writes."""
+    today = str(datetime.now().date())
+    user = await users.find_one({"user_id": user_id})
+    unlimited = bool(user and user.get("unlimited_access"))
+
+    user = await users.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {"last_request_date": today, "daily_questions": 0}},
+        upsert=True, return_document=True
+    )
+    if user.get("last_request_date") != today:
+        await users.update_one({"user_id": user_id}, {"$set": {"last_request_date": today, "daily_questions": 0}})
+
+    if unlimited:
+        await users.find_one({"user_id": user_id})
+        user = await users.find_one({"user_id": user_id})
+        session = user.get("hourly_request_session", {})
+        await users.update_one(
+            {"user_id": user_id},
+            {"$set": {"hourly_request_session.question_count": session.get("question_count", 0) + count}}
+        )
+    else:
+        user = await users.find_one({"user_id": user_id})
+        await users.update_one(
+            {"user_id": user_id},
+            {"$set": {"last_request_date": today, "daily_questions": user.get("daily_questions", 0) + count}}
+        )
+
+
+async def current_request(user_id, count):
+    state = FakeState(language="en", selected_category="national")
+    await main.process_question_count(fake_message(user_id, str(count)), state)
+
+
+async def run():
+    counter = CommandCounter()
+    db = use_benchmark_database(counter)
+    main.bot = FakeBot()
+    await seed_questions(db, "national", 500)
+    await db["users"].drop()
+    await db["quotas"].drop()
+    await db["users"].insert_many([
+        {"user_id": 1, "username": "free", "last_request_date": "2000-01-01", "daily_questions": 12},
+        {"user_id": 2, "username": "unlimited", "unlimited_access": True,
+         "unlimited_access_expiry": datetime.now() + timedelta(days=30)},
+    ])
+
+    for label, user_id in (("free user", 1), ("unlimited user", 2)):
+        for name, request in (("legacy", legacy_request(db["users"], user_id, 5)),
+                              ("current", current_request(user_id, 5))):
+            counter.reset()
+            await request
+            round_trips = counter.by_collection["users"] + counter.by_collection["quotas"]
+            print(f"{name:<8} {label:<15} users + quotas round trips: {round_trips}")
+
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+"""Post synthetic updates to the bot's webhook and measure its throughput.
+
+Run the bot in webhook mode against the fake Bot API, for example:
+
+    python benchmarks/fake_telegram.py --port 8081 --global-rate 100000 --chat-rate 100000 &
+    BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8080/webhook \\
+        TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py &
+    python benchmarks/webhook_load.py --updates 5000 --concurrency 100
+
+Each update is a /result command from one of `--users` users, which reads
+the user from MongoDB and replies through the Bot API. Like Telegram, the
+generator retries updates answered with 429 or 503 after Retry-After, and
+reports handled updates per second, latency percentiles and rejections.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def synthetic_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def run(url, secret, updates, concurrency, users, text, first_id):
+    statuses = Counter()
+    latencies = []
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    next_update = iter(range(first_id, first_id + updates))
+
+    async def deliver(session):
+        for update_id in next_update:
+            payload = synthetic_update(update_id, 100000 + update_id % users, text)
+            started = time.monotonic()
+            while True:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    statuses[response.status] += 1
+                    if response.status not in (429, 503):
+                        break
+                    await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(deliver(session) for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    print(f"updates:      {updates} in {elapsed:.2f}s ({updates / elapsed:.1f}/s)")
+    print(f"latency (ms): p50 {percentile(latencies, 0.5) * 1000:.1f}  "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f}  p99 {percentile(latencies, 0.99) * 1000:.1f}")
+    print(f"responses:    {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--text", default="/result")
+    # Update IDs must be above the bot's persisted offset, or they are acknowledged as redeliveries.
+    parser.add_argument("--first-id", type=int, default=int(time.time() * 1000))
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.secret, args.updates, args.concurrency, args.users, args.text, args.first_id))
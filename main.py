@@ -16,13 +16,19 @@ import asyncio  # For asynchronous operations and event loops
 import logging  # For logging messages and debugging
 from datetime import datetime, timedelta  # For handling dates and time calculations
 import os  # For interacting with the environment and loading environment variables
+import sys  # Interpreter path for spawning worker processes
+import signal  # Graceful shutdown of worker processes
 import calendar  # For working with calendar dates
 
 # Aiogram core imports and filter handlers
-from aiogram import Bot, Dispatcher, types, F  # Core aiogram imports
+from aiogram import Bot, Dispatcher, BaseMiddleware, types, F  # Core aiogram imports
 from aiogram.filters import Command  # Command filter for registering commands
 from aiogram.client.session.aiohttp import AiohttpSession  # HTTP session management
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware  # Outbound request hooks
+from aiogram.client.telegram import TelegramAPIServer  # Custom (e.g. local) Bot API server
 from aiogram.client.bot import DefaultBotProperties  # Set default bot properties
+from aiogram.exceptions import TelegramRetryAfter  # Raised on 429 flood-control responses
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError  # Membership lookup failures
 
 # Telegram bot-related types and Command setup
 from aiogram.types import (
@@ -35,16 +41,31 @@ from aiogram.types import (
 
 # MongoDB async driver
 from motor.motor_asyncio import AsyncIOMotorClient  # Asynchronous MongoDB driver
+from aiohttp import ClientError, ClientSession, web  # Webhook server and update forwarding
 
 # Load environment variables from .env files
 from dotenv import load_dotenv
 import re
+import json  # Session journal records
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.storage.memory import MemoryStorage  # In-memory FSM storage
+from aiogram.fsm.storage.base import BaseStorage, StorageKey  # Base for the MongoDB FSM storage
 import random
 from datetime import datetime, timedelta
 import uuid  # For generating unique session IDs
+import time  # Monotonic clock for rate limiting
+import itertools  # Tie-breaking sequence numbers for scheduler queues
+import heapq  # Deadline ordering for quiz timeouts
+import contextlib  # Keyed lock context manager
+import contextvars  # Per-task send priority
+import bisect  # Histogram bucket lookup
+import threading  # Metrics are recorded from Motor's executor threads too
+from typing import NamedTuple
+from collections import OrderedDict, deque  # LRU bookkeeping for in-process caches; per-user update queues
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo import monitoring  # Command listener for MongoDB timings
 
 
 
@@ -61,26 +82,572 @@ logging.basicConfig(
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 MONGO_URI = os.getenv("MONGO_URI")
 
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Optional Bot API server, e.g. a local fake for load tests
+
 # Initialize bot with default properties
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else AiohttpSession()
 bot = Bot(
     token=BOT_TOKEN,
+    session=session,
     default=DefaultBotProperties(parse_mode='HTML')  # Use HTML parsing by default
 )
 
-# Use in-memory FSM storage instead of Redis
-memory_storage = MemoryStorage()  # In-memory FSM storage
-dp = Dispatcher(storage=memory_storage)  # Initialize Dispatcher with in-memory storage
+### Instrumentation ###
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve Prometheus text on 127.0.0.1:METRICS_PORT/metrics (0 = off)
+
+class Histogram:
+    """Latency histogram over fixed log-spaced buckets.
+
+    Recording is one bisect and two additions; percentiles are read from the
+    bucket bounds, so they are accurate to one bucket (25%).
+    """
+
+    BOUNDS = [0.0002 * 1.25 ** i for i in range(60)]  # 0.2 ms .. ~100 s, in seconds
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.buckets[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+
+    def percentile(self, fraction: float) -> float:
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and bucket:
+                return self.BOUNDS[min(index, len(self.BOUNDS) - 1)]
+        return 0.0
+
+
+class Metrics:
+    """In-memory latency histograms keyed by (kind, name), e.g. ("mongo", "users.find").
+
+    Mongo timings arrive on the driver's executor threads, so every access to
+    the histograms goes through `lock`.
+    """
+
+    KINDS = ("handler", "mongo", "telegram")
+
+    def __init__(self):
+        self.histograms = {}
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False):
+        with self.lock:
+            histogram = self.histograms.get((kind, name))
+            if histogram is None:
+                histogram = self.histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds, error)
+
+    def report(self, limit: int = 15) -> str:
+        """Render the slowest operations of each kind by total time, for /stats."""
+        with self.lock:
+            return self._report(limit)
+
+    def _report(self, limit: int) -> str:
+        sections = [f"Uptime {time.monotonic() - self.started:.0f}s"]
+        for kind in self.KINDS:
+            rows = sorted(
+                ((name, histogram) for (k, name), histogram in self.histograms.items() if k == kind),
+                key=lambda row: row[1].total, reverse=True
+            )[:limit]
+            lines = [f"{kind:<28} {'n':>7} {'err':>5} {'p50':>7} {'p95':>7} {'p99':>7}"]
+            for name, histogram in rows:
+                lines.append(
+                    f"{name[:28]:<28} {histogram.count:>7} {histogram.errors:>5} "
+                    + " ".join(f"{histogram.percentile(p) * 1000:>7.1f}" for p in (0.5, 0.95, 0.99))
+                )
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+    def prometheus(self) -> str:
+        """Render every histogram as a Prometheus summary."""
+        with self.lock:
+            return self._prometheus()
+
+    def _prometheus(self) -> str:
+        lines = ["# TYPE prepbot_latency_seconds summary", "# TYPE prepbot_errors_total counter"]
+        for (kind, name), histogram in sorted(self.histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            for quantile in (0.5, 0.95, 0.99):
+                lines.append(f'prepbot_latency_seconds{{{labels},quantile="{quantile}"}} {histogram.percentile(quantile)}')
+            lines.append(f"prepbot_latency_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"prepbot_latency_seconds_count{{{labels}}} {histogram.count}")
+            lines.append(f"prepbot_errors_total{{{labels}}} {histogram.errors}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port: int = METRICS_PORT):
+        """Expose `prometheus()` on a local HTTP endpoint."""
+        async def handle(request):
+            return web.Response(text=self.prometheus(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+
+
+metrics = Metrics()
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Feed the duration of every MongoDB command into `metrics` as "<collection>.<command>"."""
+
+    def __init__(self):
+        self.names = {}  # request_id -> metric name, between started and succeeded/failed
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        name = f"{collection}.{event.command_name}" if isinstance(collection, str) else event.command_name
+        self.names[event.request_id] = name
+
+    def succeeded(self, event):
+        name = self.names.pop(event.request_id, event.command_name)
+        metrics.observe("mongo", name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        name = self.names.pop(event.request_id, event.command_name)
+        metrics.observe("mongo", name, event.duration_micros / 1e6, error=True)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Time each Bot API request attempt (after rate limiting) into `metrics`."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        error = True
+        try:
+            result = await make_request(bot, method)
+            error = False
+            return result
+        finally:
+            metrics.observe("telegram", method.__api_method__, time.perf_counter() - started, error)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Time every handler call into `metrics` by handler function name."""
+
+    async def __call__(self, handler, event, data: dict):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else type(event).__name__
+        started = time.perf_counter()
+        error = True
+        try:
+            result = await handler(event, data)
+            error = False
+            return result
+        finally:
+            metrics.observe("handler", name, time.perf_counter() - started, error)
+
+
+mongo_timer = MongoCommandTimer()
 
 # Initialize MongoDB client
-client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=100)  # Handle 100 concurrent connections
+client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=100, event_listeners=[mongo_timer])  # Handle 100 concurrent connections
 db = client["govtprepbuddy_database"]
 users_collection = db["users"]
 polls_collection = db["polls"]
+quotas_collection = db["quotas"]  # Day/hour-bucketed question counters
+broadcasts_collection = db["broadcasts"]  # Broadcast progress checkpoints
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "mongo")  # "mongo" (shared, persistent) or "memory" (single process)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))  # Seconds an idle FSM state is kept in MongoDB
+# Seconds a cached FSM record is trusted. Caching is only safe when each user is handled by a single
+# process, which holds for one bot process and for sharded workers. Set FSM_CACHE_TTL=0 when several
+# replicas share one webhook behind a load balancer, since any of them may get a user's next update.
+FSM_SINGLE_HANDLER = os.getenv("WORKER_PROCESSES", "1") == "1" or "WORKER_INDEX" in os.environ
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "60" if FSM_SINGLE_HANDLER else "0"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "50000"))  # FSM records kept in the read-through cache
+
+
+class MongoStorage(BaseStorage):
+    """aiogram FSM storage backed by MongoDB with an in-process read-through cache.
+
+    Each StorageKey maps to one document holding the state and data. Writes
+    go through to MongoDB and idle documents expire via a TTL index on
+    `updated_at`. With a positive `cache_ttl`, reads are served from a
+    bounded cache for that many seconds, which is only safe when every update
+    of a user reaches the same process (one bot process or sharded workers);
+    with a zero `cache_ttl` every read goes to MongoDB.
+    """
+
+    def __init__(self, collection, state_ttl: int = FSM_STATE_TTL,
+                 cache_ttl: float = FSM_CACHE_TTL, cache_size: int = FSM_CACHE_SIZE):
+        self.collection = collection
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # document id -> (state, data, expires_at)
+
+    @staticmethod
+    def _document_id(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            getattr(key, "business_connection_id", None), key.destiny
+        ))
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("updated_at", expireAfterSeconds=self.state_ttl)
+
+    def _cache_put(self, document_id: str, state, data: dict):
+        if self.cache_ttl <= 0:
+            return
+        self.cache[document_id] = (state, data, time.monotonic() + self.cache_ttl)
+        self.cache.move_to_end(document_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def _load(self, key: StorageKey):
+        document_id = self._document_id(key)
+        cached = self.cache.get(document_id)
+        if cached and cached[2] > time.monotonic():
+            self.cache.move_to_end(document_id)
+            return cached[0], cached[1]
+
+        document = await self.collection.find_one({"_id": document_id}, {"state": 1, "data": 1})
+        state = document.get("state") if document else None
+        data = document.get("data", {}) if document else {}
+        self._cache_put(document_id, state, data)
+        return state, data
+
+    async def _save(self, key: StorageKey, state, data: dict):
+        document_id = self._document_id(key)
+        self._cache_put(document_id, state, data)
+        if state is None and not data:
+            await self.collection.delete_one({"_id": document_id})
+            return
+        await self.collection.update_one(
+            {"_id": document_id},
+            {"$set": {"state": state, "data": data, "updated_at": datetime.utcnow()}},  # TTL uses UTC
+            upsert=True
+        )
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        _, data = await self._load(key)
+        await self._save(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey):
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        state, _ = await self._load(key)
+        await self._save(key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        _, data = await self._load(key)
+        return dict(data)
+
+    async def close(self) -> None:
+        self.cache.clear()
+
+
+# FSM storage: MongoDB keeps quiz flows across restarts and workers; memory is for local runs
+if FSM_STORAGE == "memory":
+    fsm_storage = MemoryStorage()
+else:
+    fsm_storage = MongoStorage(db["fsm_states"])
+dp = Dispatcher(storage=fsm_storage)
 
 # Configuration constants
 ADMIN_ID = 201319134  # Replace with your admin chat ID
 QUIZ_TIMEOUT = 300  # 5 minutes timeout for quiz sessions
-poll_tracking = {}  # Track poll_id to correct_option_id mapping
+REQUIRED_CHANNEL = "@CurrentAdda"  # Users must join this channel to use the bot
+MEMBERSHIP_POSITIVE_TTL = float(os.getenv("MEMBERSHIP_POSITIVE_TTL", "3600"))  # Seconds a confirmed member is trusted
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "60"))  # Seconds a non-member result is trusted
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))  # Users kept in the membership cache
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", "300"))  # Seconds a cached access plan is trusted
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", "100000"))  # Users kept in the entitlement cache
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Broadcast messages per second (under the 30/s global limit)
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))  # Users read and checkpointed per batch
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))  # Seconds between progress edits
+BROADCAST_LEASE_SECONDS = 60  # A running broadcast without a heartbeat for this long is claimed and resumed
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" or "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public HTTPS URL Telegram posts updates to, e.g. https://bot.example.com/webhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")  # Local path the webhook server listens on
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Expected X-Telegram-Bot-Api-Secret-Token header, if set
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))  # Parallel deliveries Telegram may open
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))  # Accepted updates waiting for a worker before 429
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))  # Updates handled concurrently in webhook mode
+UPDATE_OFFSET_SAVE_INTERVAL = 5  # Seconds between persisting the processed-update offset
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))  # >1 shards users across this many worker processes
+WORKER_INDEX = int(os.environ["WORKER_INDEX"]) if "WORKER_INDEX" in os.environ else None  # Set for worker processes
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8090"))  # Worker i listens on 127.0.0.1:WORKER_BASE_PORT + i
+DAILY_QUESTION_LIMIT = 30  # Questions per day for free users
+HOURLY_QUESTION_LIMIT = 60  # Questions per clock hour for unlimited users
+RESET_BATCH_SIZE = int(os.getenv("RESET_BATCH_SIZE", "1000"))  # Users reset per batch at midnight
+RESET_BATCH_PAUSE = float(os.getenv("RESET_BATCH_PAUSE", "0.1"))  # Seconds between reset batches
+LEADERBOARD_SIZE = 10  # Entries shown on /leaderboard
+LEADERBOARD_REBUILD_INTERVAL = int(os.getenv("LEADERBOARD_REBUILD_INTERVAL", "600"))  # Seconds between resyncs (0 = never)
+POLL_TRACKING_TTL = int(os.getenv("POLL_TRACKING_TTL", "86400"))  # Seconds a sent poll can still be scored
+POLL_TRACKING_MAX_ENTRIES = int(os.getenv("POLL_TRACKING_MAX_ENTRIES", "100000"))  # In-memory tier bound
+POLL_TRACKING_FLUSH_INTERVAL = float(os.getenv("POLL_TRACKING_FLUSH_INTERVAL", "1"))  # Seconds between batch writes
+SESSION_WRITE_BEHIND = os.getenv("SESSION_WRITE_BEHIND", "0") == "1"  # Buffer per-answer session writes
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "2"))  # Seconds between session flushes
+SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", "500"))  # Buffered answers that force a flush
+SESSION_JOURNAL_PATH = os.getenv("SESSION_JOURNAL_PATH", "session_journal.jsonl")  # Crash-recovery journal
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "5000"))  # Full question documents kept in memory
+QUESTION_REFRESH_INTERVAL = int(os.getenv("QUESTION_REFRESH_INTERVAL", "300"))  # Seconds between rescans without change streams
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))  # Bot API calls per second across all chats
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))  # Messages per second to a single chat
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))  # Messages a chat may receive back-to-back
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))  # Retries after a 429 before giving up
+CALLBACK_DEDUP_WINDOW = float(os.getenv("CALLBACK_DEDUP_WINDOW", "1.5"))  # Seconds a repeated button press is ignored
+
+if WORKER_INDEX is not None:
+    SEND_GLOBAL_RATE /= WORKER_PROCESSES  # Workers split the bot-wide send budget
+    SESSION_JOURNAL_PATH += f".{WORKER_INDEX}"  # One journal per worker process
+
+### Outbound Rate Limiting ###
+
+PRIORITY_INTERACTIVE = 0  # Replies to a user's own action
+PRIORITY_BULK = 1  # Broadcasts and other mass sends
+send_priority = contextvars.ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+# Calls that are never throttled (long polling and bot setup).
+UNTHROTTLED_METHODS = {"getUpdates", "getMe", "setWebhook", "deleteWebhook", "getWebhookInfo", "setMyCommands"}
+
+
+class TokenBucket:
+    """Token bucket that refills at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 when one is available now)."""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """Hold the bucket closed, e.g. for a RetryAfter period reported by Telegram."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class SendScheduler:
+    """Central scheduler for outbound Bot API calls.
+
+    Callers wait in a queue ordered by (priority, arrival). A single loop
+    releases them while both the global bucket and the target chat's bucket
+    have tokens, so a chat at its limit never holds up other chats and
+    interactive replies overtake queued bulk sends.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: int = SEND_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}  # chat_id -> TokenBucket
+        self.waiters = []  # (priority, seq, chat_id, future)
+        self.sequence = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id=None, priority: int = PRIORITY_INTERACTIVE):
+        """Wait until a call to `chat_id` (None for chat-less calls) may be made."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((priority, next(self.sequence), chat_id, future))
+        self.wakeup.set()
+        await future
+
+    def block(self, chat_id, seconds: float):
+        """Apply a RetryAfter penalty to a chat, or globally for chat-less calls."""
+        bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+        bucket.block(seconds)
+        self.wakeup.set()
+
+    def _release_ready(self):
+        """Release every waiter that may proceed now; return seconds until the next one can."""
+        now = time.monotonic()
+        next_delay = None
+        blocked_chats = set()
+        remaining = []
+
+        ordered = sorted(self.waiters)
+        for index, waiter in enumerate(ordered):
+            priority, _, chat_id, future = waiter
+            if future.done():
+                continue  # Caller was cancelled
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                next_delay = global_delay if next_delay is None else min(next_delay, global_delay)
+                remaining.extend(ordered[index:])
+                break
+
+            bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+            chat_delay = bucket.delay(now) if bucket and chat_id not in blocked_chats else 0.0
+            if chat_id in blocked_chats or chat_delay > 0:
+                # Keep per-chat FIFO: later calls to this chat wait behind this one.
+                blocked_chats.add(chat_id)
+                if chat_delay > 0:
+                    next_delay = chat_delay if next_delay is None else min(next_delay, chat_delay)
+                remaining.append(waiter)
+                continue
+
+            self.global_bucket.take()
+            if bucket:
+                bucket.take()
+            future.set_result(None)
+
+        self.waiters = [waiter for waiter in remaining if not waiter[3].done()]
+
+        if len(self.chat_buckets) > 10000:
+            self.chat_buckets = {
+                chat_id: bucket for chat_id, bucket in self.chat_buckets.items() if not bucket.idle(now)
+            }
+        return next_delay
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            next_delay = self._release_ready() if self.waiters else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=next_delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Route Bot API calls through the send scheduler and retry on RetryAfter."""
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int = SEND_MAX_RETRIES):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        if api_method in UNTHROTTLED_METHODS:
+            return await make_request(bot, method)
+
+        # Only message-producing calls count against the per-chat limit.
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(chat_id, int) or not api_method.startswith(("send", "copy", "forward")):
+            chat_id = None
+
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(chat_id, send_priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"{api_method} to {chat_id} rate limited; retrying in {e.retry_after}s.")
+                self.scheduler.block(chat_id, e.retry_after)
+
+
+send_scheduler = SendScheduler()
+bot.session.middleware(RateLimitMiddleware(send_scheduler))
+bot.session.middleware(ApiTimingMiddleware())  # Registered after the rate limiter, so it times only the request
+
+### Per-User Serialization ###
+
+class KeyedLocks:
+    """Registry of asyncio locks by key; a lock is dropped as soon as nobody holds or awaits it."""
+
+    def __init__(self):
+        self.locks = {}  # key -> [lock, tasks holding or waiting]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        entry = self.locks.get(key)
+        if entry is None:
+            entry = self.locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.locks[key]
+
+
+class UserSerializationMiddleware(BaseMiddleware):
+    """Handle one update at a time per user, and drop repeated button presses.
+
+    Updates from the same user (messages, callbacks, poll answers) wait for
+    each other, so handlers never race on that user's session, quota or FSM
+    state; different users still run in parallel. In webhook and worker
+    mode WebhookServer already queues updates per user before they take a
+    worker, so the lock is uncontended there and only guards polling mode.
+    A callback with the same data on the same message within
+    CALLBACK_DEDUP_WINDOW seconds is answered and ignored.
+    """
+
+    def __init__(self, dedup_window: float = CALLBACK_DEDUP_WINDOW):
+        self.locks = KeyedLocks()
+        self.dedup_window = dedup_window
+        self.recent_callbacks = OrderedDict()  # (user_id, message_id, data) -> monotonic time of the press
+
+    def is_duplicate(self, callback: types.CallbackQuery) -> bool:
+        now = time.monotonic()
+        while self.recent_callbacks and next(iter(self.recent_callbacks.values())) < now - self.dedup_window:
+            self.recent_callbacks.popitem(last=False)
+
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        key = (callback.from_user.id, message_id, callback.data)
+        if key in self.recent_callbacks:
+            return True
+        self.recent_callbacks[key] = now
+        return False
+
+    async def __call__(self, handler, event: types.Update, data: dict):
+        if event.callback_query and self.is_duplicate(event.callback_query):
+            with contextlib.suppress(TelegramBadRequest):
+                await event.callback_query.answer()  # Stop the button's loading spinner
+            return None
+
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        async with self.locks.hold(user.id):
+            return await handler(event, data)
+
+dp.update.outer_middleware(UserSerializationMiddleware())
+for observer in (dp.message, dp.callback_query, dp.poll_answer):
+    observer.middleware(HandlerTimingMiddleware())
 
 ### Function Definitions Start Here ###
 
@@ -143,7 +710,7 @@ async def start(message: types.Message):
         return  # Stop further execution if not a member
 
     today = datetime.now().date()
-    user = await users_collection.find_one({"user_id": user_id})
+    user = await users_collection.find_one({"user_id": user_id}, {"_id": 0, "last_active_date": 1})
 
     if not user or user.get("last_active_date") != str(today):
         await users_collection.update_one(
@@ -154,7 +721,7 @@ async def start(message: types.Message):
 
     await users_collection.update_one(
         {"user_id": user_id},
-        {"$set": {"username": username}},
+        {"$set": {"username": username}, "$unset": {"blocked": ""}},  # Reachable again if they had blocked us
         upsert=True
     )
 
@@ -166,7 +733,7 @@ async def handle_join_check(call: types.CallbackQuery):
     """Handle the join confirmation from the user."""
     user_id = call.from_user.id
 
-    if await check_channel_membership(user_id):
+    if await check_channel_membership(user_id, refresh=True):
         await call.answer("✅ Membership confirmed!", show_alert=True)
         await show_main_menu(call.message)
     else:
@@ -274,14 +841,10 @@ async def process_question_count(message: types.Message, state: FSMContext):
     """Process the number of questions requested by the user."""
     user_id = message.from_user.id
 
-    # Retrieve FSM data and user details from the database
+    # Retrieve FSM data
     data = await state.get_data()
     language = data.get("language")
 
-    # Check if the user has unlimited access and validate the daily limit
-    has_unlimited_access = await has_valid_unlimited_access(user_id)
-    daily_questions = await get_user_daily_questions(user_id)
-
     # Parse the requested number of questions
     try:
         count = int(message.text)
@@ -291,18 +854,20 @@ async def process_question_count(message: types.Message, state: FSMContext):
         await message.reply("❌ Please enter a valid number between 1 and 15.")
         return
 
-    # If the user has unlimited access, check the hourly limit.
-    if has_unlimited_access:
-        can_request, wait_message = await can_request_more_questions(user_id)
-        if not can_request:
-            await message.reply(wait_message)
+    # Check if the user has unlimited access (cached; usually no database read)
+    has_unlimited_access = await has_valid_unlimited_access(user_id)
+
+    # Check and spend the quota in one atomic operation: hourly for unlimited users, daily otherwise.
+    allowed, used = await consume_question_quota(user_id, count, hourly=has_unlimited_access)
+    if not allowed:
+        if has_unlimited_access:
+            await message.reply(
+                f"⏳ You've reached your limit of {HOURLY_QUESTION_LIMIT} questions this hour. "
+                f"Please try again in {hourly_quota_reset_in()}."
+            )
             return
-        # Update the hourly question count.
-        await update_hourly_request_count(user_id, count)
 
-    # Ensure the user does not exceed the daily limit (only for non-unlimited users).
-    if not has_unlimited_access and daily_questions + count > 30:
-        remaining = max(0, 30 - daily_questions)
+        remaining = max(0, DAILY_QUESTION_LIMIT - used)
         if remaining > 0:
             await message.reply(f"⚠️ You can only request {remaining} more questions today.")
         else:
@@ -320,23 +885,21 @@ async def process_question_count(message: types.Message, state: FSMContext):
             )
         return
 
-    # Fetch questions based on the user's selection
-    questions = await fetch_questions_by_category_or_date(state)
-    if not questions:
+    # Fetch a random sample of questions based on the user's selection
+    selected_questions = await fetch_questions_by_category_or_date(state, count, language)
+    if not selected_questions:
+        await refund_question_quota(user_id, count, hourly=has_unlimited_access)
         await message.reply("❌ No questions found for your selection.")
         await show_main_menu(message)
         await state.clear()
         return
 
-    # Send the quiz to the user and update the daily question count for non-unlimited users.
-    selected_questions = random.sample(questions, min(count, len(questions)))
+    # Send the quiz to the user.
     await send_quiz(message, selected_questions, count, language)
 
-    # Increment the daily question count only for non-unlimited users.
     if not has_unlimited_access:
-        await update_user_daily_questions(user_id, count)
         await message.reply(
-            f"✅ {count} questions sent! {30 - daily_questions - count} questions remaining today."
+            f"✅ {count} questions sent! {max(0, DAILY_QUESTION_LIMIT - used)} questions remaining today."
         )
 
     # Clear the state after sending the quiz.
@@ -344,17 +907,17 @@ async def process_question_count(message: types.Message, state: FSMContext):
 
 
 
-async def fetch_questions_by_category_or_date(state: FSMContext):
-    """Fetch questions based on the user's selection."""
+async def fetch_questions_by_category_or_date(state: FSMContext, count: int, language: str):
+    """Fetch up to `count` random questions based on the user's selection."""
     data = await state.get_data()  # Retrieve user session data
 
     if "selected_category" in data:
         category = data["selected_category"]
-        return await fetch_questions_by_category(category)  # Use the improved function
+        return await fetch_questions_by_category(category, count, language)
 
     if {"selected_year", "selected_month", "selected_day"} <= data.keys():
         return await fetch_questions_by_date(
-            data["selected_year"], data["selected_month"], data["selected_day"]
+            data["selected_year"], data["selected_month"], data["selected_day"], count, language
         )
 
     return []  # Return empty list if no valid selection
@@ -382,10 +945,10 @@ async def handle_quiz_selection(call: types.CallbackQuery):
 @dp.callback_query(F.data == "Track Plan Details")
 async def handle_track_plan(call: types.CallbackQuery):
     """Handler for tracking plan details."""
-    user = await users_collection.find_one({"user_id": call.from_user.id})
+    entitlement = await entitlement_cache.get(call.from_user.id)
 
-    if user and user.get("unlimited_access"):
-        expiry_date = user.get("unlimited_access_expiry")
+    if entitlement.unlimited_access:
+        expiry_date = entitlement.expiry_date
         await call.message.answer(
             f"📅 Your unlimited access is valid until {expiry_date.strftime('%d %B %Y')}."
         )
@@ -426,6 +989,180 @@ async def handle_pay_for_access(call: types.CallbackQuery):
 
 
 
+class BroadcastJob:
+    """Resumable, paced broadcast of one message to every reachable user.
+
+    Users are paged by `_id` in batches of BROADCAST_BATCH_SIZE and sent to
+    at BROADCAST_RATE messages per second (RetryAfter is handled by the send
+    scheduler). After each batch the position and counters are checkpointed
+    in `broadcasts`, so a restarted bot resumes where it stopped. Users who
+    blocked the bot are flagged and skipped by later broadcasts, and the
+    admin's status message is edited with live progress.
+    """
+
+    def __init__(self, document: dict):
+        self.document = document
+        self.id = document["_id"]
+        self.text = document["text"]
+        self.admin_chat_id = document["admin_chat_id"]
+        self.status_message_id = document.get("status_message_id")
+        self.last_user_oid = document.get("last_user_oid")
+        self.counters = {key: document.get(key, 0) for key in ("sent", "blocked", "failed")}
+        self.total = document.get("total", 0)
+        self.started = time.monotonic()
+        self.processed_since_start = 0
+
+    @classmethod
+    async def start(cls, message: types.Message, text: str):
+        total = await users_collection.count_documents({"blocked": {"$ne": True}})
+        status = await message.answer(f"📣 Broadcast started to {total} users...")
+        document = {
+            "text": text,
+            "admin_chat_id": message.chat.id,
+            "status_message_id": status.message_id,
+            "total": total,
+            "status": "running",
+            "created_at": datetime.now(),
+            "heartbeat_at": datetime.now()
+        }
+        document["_id"] = (await broadcasts_collection.insert_one(document)).inserted_id
+        return cls(document)
+
+    async def send(self, user_id: int) -> str:
+        try:
+            await bot.send_message(user_id, self.text)
+            return "sent"
+        except TelegramForbiddenError:
+            return "blocked"
+        except Exception as e:
+            logging.error(f"Failed to send message to {user_id}: {e}")
+            return "failed"
+
+    def progress_text(self, state: str) -> str:
+        done = sum(self.counters.values())
+        elapsed = time.monotonic() - self.started
+        rate = self.processed_since_start / elapsed if elapsed else 0.0
+        return (
+            f"📣 Broadcast {state}: {done}/{self.total} processed\n"
+            f"✅ Sent: {self.counters['sent']} | 🚫 Blocked: {self.counters['blocked']} | "
+            f"⚠️ Failed: {self.counters['failed']}\n"
+            f"⚡ {rate:.1f} msg/s"
+        )
+
+    async def report(self, state: str):
+        try:
+            if self.status_message_id:
+                await bot.edit_message_text(
+                    self.progress_text(state), chat_id=self.admin_chat_id, message_id=self.status_message_id
+                )
+            else:
+                await bot.send_message(self.admin_chat_id, self.progress_text(state))
+        except Exception as e:
+            logging.debug(f"Could not update broadcast progress: {e}")
+
+    async def heartbeat(self):
+        """Keep the job's lease fresh while it runs, even if a batch is slowed down by RetryAfter."""
+        while True:
+            await asyncio.sleep(BROADCAST_LEASE_SECONDS / 4)
+            try:
+                await broadcasts_collection.update_one(
+                    {"_id": self.id, "status": "running"}, {"$set": {"heartbeat_at": datetime.now()}}
+                )
+            except PyMongoError as e:
+                logging.warning(f"Broadcast {self.id} heartbeat failed: {e}")
+
+    async def run(self):
+        """Send the broadcast; on a MongoDB error the lease lapses and `resume_broadcasts` retries it."""
+        heartbeat = asyncio.create_task(self.heartbeat())
+        try:
+            await self.send_all()
+        except PyMongoError as e:
+            logging.error(f"Broadcast {self.id} interrupted: {e}; it will resume from its last checkpoint.")
+        except Exception as e:
+            logging.exception(f"Broadcast {self.id} failed: {e}")
+            with contextlib.suppress(PyMongoError):
+                await broadcasts_collection.update_one(
+                    {"_id": self.id}, {"$set": {"status": "failed", "error": str(e), "completed_at": datetime.now()}}
+                )
+            await self.report("failed")
+        finally:
+            heartbeat.cancel()
+
+    async def send_all(self):
+        send_priority.set(PRIORITY_BULK)  # Queue behind interactive replies
+        interval = 1 / BROADCAST_RATE
+        next_send = time.monotonic()
+        last_report = time.monotonic()
+
+        while True:
+            query = {"blocked": {"$ne": True}}
+            if self.last_user_oid is not None:
+                query["_id"] = {"$gt": self.last_user_oid}
+            batch = await users_collection.find(query, {"user_id": 1}).sort("_id", 1).limit(
+                BROADCAST_BATCH_SIZE
+            ).to_list(length=BROADCAST_BATCH_SIZE)
+            if not batch:
+                break
+
+            tasks = []
+            for user in batch:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_send = max(next_send, time.monotonic()) + interval
+                tasks.append(asyncio.create_task(self.send(user["user_id"])))
+            outcomes = await asyncio.gather(*tasks)
+
+            blocked_ids = []
+            for user, outcome in zip(batch, outcomes):
+                self.counters[outcome] += 1
+                if outcome == "blocked":
+                    blocked_ids.append(user["user_id"])
+            self.processed_since_start += len(batch)
+            self.last_user_oid = batch[-1]["_id"]
+
+            if blocked_ids:
+                await users_collection.update_many({"user_id": {"$in": blocked_ids}}, {"$set": {"blocked": True}})
+            await broadcasts_collection.update_one(
+                {"_id": self.id},
+                {"$set": {"last_user_oid": self.last_user_oid, **self.counters, "heartbeat_at": datetime.now()}}
+            )
+
+            if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await self.report("in progress")
+
+        await broadcasts_collection.update_one(
+            {"_id": self.id}, {"$set": {"status": "completed", "completed_at": datetime.now()}}
+        )
+        await self.report("completed")
+
+
+async def resume_broadcasts():
+    """Keep resuming broadcasts whose worker stopped before finishing them.
+
+    A running job refreshes `heartbeat_at` every quarter lease, so a job is
+    claimed once its lease lapses: after a redeploy or crash, or after a
+    MongoDB error stopped it.
+    """
+    while True:
+        stale = datetime.now() - timedelta(seconds=BROADCAST_LEASE_SECONDS)
+        try:
+            while True:
+                # Claim one unfinished broadcast at a time so concurrent workers don't double-send.
+                document = await broadcasts_collection.find_one_and_update(
+                    {"status": "running", "heartbeat_at": {"$lt": stale}},
+                    {"$set": {"heartbeat_at": datetime.now()}},
+                    return_document=ReturnDocument.AFTER
+                )
+                if not document:
+                    break
+                logging.info(f"Resuming broadcast {document['_id']} after {document.get('last_user_oid')}.")
+                asyncio.create_task(BroadcastJob(document).run())
+        except PyMongoError as e:
+            logging.error(f"Error resuming broadcasts: {e}")
+        await asyncio.sleep(BROADCAST_LEASE_SECONDS / 4)
+
 @dp.message(Command("broadcast"))
 async def broadcast_message(message: types.Message):
     """Broadcast a message to all users."""
@@ -433,17 +1170,23 @@ async def broadcast_message(message: types.Message):
         await message.reply("This command is restricted to admins.")
         return
 
-    users = await users_collection.find({}, {"user_id": 1}).to_list(length=None)
+    text = message.text.partition(" ")[2].strip()
+    if not text:
+        await message.reply("Usage: /broadcast <message>")
+        return
 
-    async def send_message(user):
-        try:
-            await bot.send_message(user["user_id"], message.text)
-        except Exception as e:
-            logging.error(f"Failed to send message to {user['user_id']}: {e}")
+    job = await BroadcastJob.start(message, text)
+    asyncio.create_task(job.run())  # Runs in the background; progress is reported by editing the status message
 
-    await asyncio.gather(*(send_message(user) for user in users))
-    await message.answer("Broadcast completed!")
+@dp.message(Command("stats"))
+async def show_stats(message: types.Message):
+    """Show latency percentiles (ms) of handlers, MongoDB commands and Bot API calls."""
+    if not is_admin(message.from_user.id):
+        await message.reply("This command is restricted to admins.")
+        return
 
+    for chunk in chunk_text(metrics.report(), 4000):
+        await message.answer(f"<pre>{chunk}</pre>")
 
 
 
@@ -451,7 +1194,7 @@ async def broadcast_message(message: types.Message):
 async def show_result(message: types.Message):
     """Display the user's last quiz result."""
     user_id = message.from_user.id
-    user = await users_collection.find_one({"user_id": user_id})
+    user = await users_collection.find_one({"user_id": user_id}, {"_id": 0, "last_result": 1})
 
     if not user or "last_result" not in user:
         await message.answer("No results found for your account.")
@@ -470,23 +1213,65 @@ async def handle_join_check(call: types.CallbackQuery):
     """Handle the join confirmation from the user."""
     user_id = call.from_user.id
 
-    if await check_channel_membership(user_id):
+    if await check_channel_membership(user_id, refresh=True):
         await call.answer("✅ Membership confirmed!")
         await show_main_menu(call.message)
     else:
         await call.answer("❌ You haven't joined yet. Please join and try again.")
 
-async def check_channel_membership(user_id: int) -> bool:
+class MembershipCache:
+    """Cache of channel-membership lookups with separate positive and negative TTLs.
+
+    Concurrent checks for the same user share one `get_chat_member` call, and
+    `refresh=True` bypasses the cached result (used by the "I've joined"
+    button). Failed lookups are not cached.
+    """
+
+    def __init__(self, positive_ttl: float = MEMBERSHIP_POSITIVE_TTL, negative_ttl: float = MEMBERSHIP_NEGATIVE_TTL,
+                 max_entries: int = MEMBERSHIP_CACHE_SIZE):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # user_id -> (is_member, expires_at)
+        self.inflight = {}  # user_id -> lookup task shared by concurrent callers
+
+    async def _lookup(self, user_id: int) -> bool:
+        member = await bot.get_chat_member(REQUIRED_CHANNEL, user_id)
+        is_member = member.status in ['member', 'administrator', 'creator']
+
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self.entries[user_id] = (is_member, time.monotonic() + ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return is_member
+
+    async def check(self, user_id: int, refresh: bool = False) -> bool:
+        if not refresh:
+            cached = self.entries.get(user_id)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+
+        task = self.inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._lookup(user_id))
+            self.inflight[user_id] = task
+            task.add_done_callback(lambda _: self.inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+
+membership_cache = MembershipCache()
+
+async def check_channel_membership(user_id: int, refresh: bool = False) -> bool:
     """Check if the user is a member of the required channel."""
     try:
         # Ensure the bot can check this channel's members
-        member = await bot.get_chat_member("@CurrentAdda", user_id)
-        return member.status in ['member', 'administrator', 'creator']
-    except aiogram.exceptions.ChatNotFound:
-        logging.error("Channel not found or bot is not an admin.")
+        return await membership_cache.check(user_id, refresh)
+    except TelegramBadRequest as e:
+        logging.error(f"Channel not found or bot is not an admin: {e}")
         return False  # Bot is not able to access the channel's data
-    except aiogram.exceptions.BotKicked:
-        logging.error("Bot has been kicked from the channel.")
+    except TelegramForbiddenError as e:
+        logging.error(f"Bot has been kicked from the channel: {e}")
         return False
     except Exception as e:
         logging.error(f"Error checking membership: {e}")
@@ -496,144 +1281,106 @@ async def check_channel_membership(user_id: int) -> bool:
 
 
 
-@dp.poll_answer()
-async def handle_poll_answer(poll_answer: PollAnswer):
-    """Handle poll answers."""
-    user_id = poll_answer.user.id
-    poll_id = poll_answer.poll_id
-    selected_option = poll_answer.option_ids[0]  # User’s selected option
-
-    # Retrieve the correct option for this poll
-    correct_option_id = poll_tracking.get(poll_id)
-
-    # Fetch user session from the database
-    session = await db["user_sessions"].find_one({"user_id": user_id})
-
-    if not session:
-        await bot.send_message(user_id, "❌ No active session found.")
-        return
-
-    answered = session.get("answered", 0)
-    sent = session.get("sent", 0)
-
-    # Award points if the answer is correct
-    if correct_option_id is not None and selected_option == correct_option_id:
-        await db["user_sessions"].update_one(
-            {"user_id": user_id}, {"$addToSet": {"correct_questions": poll_id}}
-        )
-
-    # Increment the answered count
-    await db["user_sessions"].update_one(
-        {"user_id": user_id}, {"$inc": {"answered": 1}}
-    )
-
-    # If all questions are answered, show the result
-    if answered + 1 >= sent:
-        await store_and_show_result(user_id, poll_answer.user.id)  # Corrected function call
-
-
-async def store_and_show_result(user_id, chat_id):
-    """Store the quiz result and display it to the user."""
-    session = await db["user_sessions"].find_one({"user_id": user_id})
-
-    if not session:
-        await bot.send_message(chat_id, "❌ No session found.")
-        return
-
-    question_ids = session.get("question_ids", [])
-    correct_answers_today = session.get("correct_questions", [])
-    total_answered = session.get("answered", 0)
-    sent = session.get("sent", 0)
-    score = len(correct_answers_today)
-
-    selected_language = session.get("selected_language", "en")
-    explanations = []
-
-    for question_id in question_ids:
-        question = await polls_collection.find_one({"_id": question_id})
-        if question:
-            lang_data = question['languages'].get(selected_language, {})
-            explanation = (
-                f"Q: {lang_data.get('question', 'N/A')}\n"
-                f"Explanation: {lang_data.get('explanation', 'No explanation available.')}"
-            )
-            explanations.append(explanation)
-
-    explanation_text = "\n\n".join(explanations)
-    result_message = (
-        f"📊 Quiz Summary:\n"
-        f"Total Questions Answered: {total_answered}\n"
-        f"Score: {score}/{sent}\n\n"
-        f"📄 Explanations:\n{explanation_text}"
-    )
-
-    chunks = chunk_text(result_message, 4096)
-
-    for chunk in chunks:
-        await bot.send_message(chat_id, chunk)
-
-    result = {
-        "user_id": user_id,
-        "score": score,
-        "total_questions": sent,
-        "correct_answers": score,
-        "date": datetime.now()
-    }
-    await db["results"].insert_one(result)
-
-    await users_collection.update_one(
-        {"user_id": user_id},
-        {
-            "$inc": {"daily_score": score, "monthly_score": score, "total_score": score},
-            "$set": {"last_result": result}
-        },
-        upsert=True
-    )
-
-    await db["user_sessions"].delete_one({"user_id": user_id})
+def shard_filter() -> dict:
+    """Restrict a per-user query to the users owned by this worker process."""
+    if WORKER_INDEX is None:
+        return {}
+    return {"user_id": {"$mod": [WORKER_PROCESSES, WORKER_INDEX]}}
 
+class QuizTimeouts:
+    """Single scheduler for every quiz session deadline.
 
-def chunk_text(text, max_length=4096):
-    """Split long text into chunks within Telegram's message limit."""
-    chunks = []
-    while text:
-        if len(text) <= max_length:
-            chunks.append(text)
-            break
-        split_index = text.rfind('\n', 0, max_length)
-        if split_index == -1:
-            split_index = max_length
-        chunks.append(text[:split_index])
-        text = text[split_index:].strip()
-    return chunks
+    Deadlines sit in a heap driven by one loop instead of one sleeping task
+    per quiz. When the earliest deadline passes, all expired, unfinished
+    sessions are found with one query on the `deadline` field and finalized.
+    Finalized sessions are cancelled so their deadlines never wake the loop,
+    and the heap is rebuilt from `user_sessions` on startup.
+    """
 
-async def check_quiz_timeout(user_id, session_id, chat_id, timeout_duration):
-    """Check if the quiz has timed out and display the result if necessary."""
-    try:
-        # Wait for the dynamically calculated timeout duration
-        await asyncio.sleep(timeout_duration)
+    def __init__(self, collection):
+        self.collection = collection
+        self.heap = []  # (deadline timestamp, session_id)
+        self.deadlines = {}  # session_id -> deadline timestamp for sessions still pending
+        self.wakeup = asyncio.Event()
 
-        # Re-fetch the session to ensure it's still valid
-        session = await db["user_sessions"].find_one({"user_id": user_id, "session_id": session_id})
+    def schedule(self, session_id: str, deadline: datetime):
+        timestamp = deadline.timestamp()
+        self.deadlines[session_id] = timestamp
+        heapq.heappush(self.heap, (timestamp, session_id))
+        if self.heap[0][1] == session_id:
+            self.wakeup.set()  # New earliest deadline
 
-        # If the session is still active and not all questions are answered
-        if session and session.get("answered", 0) < session.get("sent", 0):
-            await bot.send_message(chat_id, "⏳ Time's up! Here's your quiz summary:")
-            await store_and_show_result(user_id, chat_id)
+    def cancel(self, session_id: str):
+        """Forget a session's deadline; its heap entry is skipped lazily."""
+        self.deadlines.pop(session_id, None)
 
-    except Exception as e:
-        logging.error(f"Error in check_quiz_timeout: {e}")
+    async def rebuild(self):
+        """Reschedule unfinished sessions that survived a restart."""
+        cursor = self.collection.find(
+            {"finalized": {"$ne": True}, "deadline": {"$exists": True}, **shard_filter()},
+            {"session_id": 1, "deadline": 1}
+        )
+        async for session in cursor:
+            self.schedule(session["session_id"], session["deadline"])
+
+    async def sweep(self):
+        """Finalize every expired, unfinished session found by one query."""
+        expired = await self.collection.find(
+            {"deadline": {"$lte": datetime.now()}, "finalized": {"$ne": True}, **shard_filter()},
+            {"user_id": 1, "session_id": 1, "chat_id": 1}
+        ).to_list(length=None)
+
+        async def expire(session):
+            self.cancel(session["session_id"])
+            chat_id = session.get("chat_id", session["user_id"])
+            # Finalize the session unless the last answer already did
+            claimed = await claim_session_result(session["user_id"], session["session_id"])
+            if claimed:
+                await bot.send_message(chat_id, "⏳ Time's up! Here's your quiz summary:")
+                await store_and_show_result(session["user_id"], chat_id, claimed)
+
+        results = await asyncio.gather(*(expire(session) for session in expired), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error(f"Error expiring quiz session: {result}")
+
+    async def run(self):
+        await self.rebuild()
+        while True:
+            # Drop heap entries for sessions that finished or were rescheduled.
+            while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+
+            self.wakeup.clear()
+            timeout = max(0.0, self.heap[0][0] - time.time()) if self.heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                    continue  # Re-evaluate the earliest deadline
+                except asyncio.TimeoutError:
+                    pass
+
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                heapq.heappop(self.heap)
+            try:
+                await self.sweep()
+            except PyMongoError as e:
+                logging.error(f"Error sweeping quiz timeouts: {e}")
+
+
+quiz_timeouts = QuizTimeouts(db["user_sessions"])
 
 
 @dp.message(Command("track_plan"))
 async def handle_track_plan_command(message: types.Message):
     """Handle /track_plan command to display the user's plan details and free questions left."""
     user_id = message.from_user.id
-    user = await users_collection.find_one({"user_id": user_id})
+    entitlement = await entitlement_cache.get(user_id)
 
     # Check if the user has unlimited access
-    if user and user.get("unlimited_access"):
-        expiry_date = user.get("unlimited_access_expiry")
+    if entitlement.unlimited_access:
+        expiry_date = entitlement.expiry_date
         await message.answer(
             f"🎉 *You are an Unlimited User!* \n"
             f"🗓 *Your Access Valid Until* : {expiry_date.strftime('%d %B %Y')}.\n"
@@ -643,7 +1390,7 @@ async def handle_track_plan_command(message: types.Message):
 
     # Fetch free questions left today
     daily_questions = await get_user_daily_questions(user_id)
-    questions_left = max(0, 30 - daily_questions)  # Ensure non-negative
+    questions_left = max(0, DAILY_QUESTION_LIMIT - daily_questions)  # Ensure non-negative
 
     # Prepare message for free users
     free_user_message = (
@@ -675,11 +1422,11 @@ async def handle_track_plan_command(message: types.Message):
 async def handle_pay_command(message: types.Message):
     """Handle /pay command to display payment instructions."""
     user_id = message.from_user.id
-    user = await users_collection.find_one({"user_id": user_id})
+    entitlement = await entitlement_cache.get(user_id)
 
     # Check if the user already has unlimited access
-    if user and user.get("unlimited_access"):
-        expiry_date = user.get("unlimited_access_expiry")
+    if entitlement.unlimited_access:
+        expiry_date = entitlement.expiry_date
         if expiry_date and datetime.now() <= expiry_date:
             await message.answer(
                 f"🎉 *You already have unlimited access!* 🎉\n"
@@ -743,33 +1490,6 @@ async def handle_verify_payment(call: types.CallbackQuery):
         logging.error(f"Failed to send verification request to admin: {e}")
         await call.message.answer("⚠️ Could not send your request. Please try again later.")
 
-async def grant_access(user_id: int, duration_days: int = 30):
-    """Grant unlimited access to a user."""
-    expiry_date = datetime.now() + timedelta(days=duration_days)
-
-    # Update the user’s access details in the database
-    await users_collection.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "unlimited_access": True,
-                "unlimited_access_expiry": expiry_date,
-                "daily_questions": float('inf')  # Set to unlimited
-            }
-        },
-        upsert=True
-    )
-
-    # Try to send a notification message to the user
-    try:
-        await bot.send_message(
-            user_id,
-            f"🎉 Congratulations! You now have unlimited access until {expiry_date.strftime('%d %B %Y')}."
-        )
-    except Exception as e:
-        # Handle the case where the message couldn't be sent
-        logging.error(f"Failed to notify user {user_id}: {e}")
-
 @dp.message(Command("grant_access"))
 async def handle_grant_access(message: types.Message):
     """Admin command to grant unlimited access."""
@@ -786,7 +1506,7 @@ async def handle_grant_access(message: types.Message):
     if target.isdigit():
         user_id = int(target)
     else:
-        user = await users_collection.find_one({"username": target})
+        user = await users_collection.find_one({"username": target}, {"_id": 0, "user_id": 1})
         if not user:
             await message.reply("User not found.")
             return
@@ -818,81 +1538,106 @@ async def handle_revoke_access(message: types.Message):
 
     await users_collection.update_one(
         {"user_id": user_id},
-        {
-            "$unset": {"unlimited_access": "", "unlimited_access_expiry": ""},
-            "$set": {"daily_questions": 30}  # Limit to 30 questions daily
-        }
+        {"$unset": {"unlimited_access": "", "unlimited_access_expiry": ""}}
     )
+    entitlement_cache.invalidate(user_id)
 
     await message.reply(f"✅ Unlimited access revoked for user {user_id}.")
 
-async def can_request_more_questions(user_id: int) -> tuple[bool, str | None]:
-    """Check if the user with unlimited access can request more questions."""
-    user = await users_collection.find_one({"user_id": user_id})
-
-    if not user or not user.get("unlimited_access"):
-        # This function only applies to unlimited users, other users are handled separately.
-        return False, None
+def question_quota_bucket(user_id: int, hourly: bool, now: datetime | None = None) -> str:
+    """Key of the counter for the current day (or clock hour) of a user's quota."""
+    now = now or datetime.now()
+    return f"{user_id}:{now:%Y-%m-%dT%H}" if hourly else f"{user_id}:{now:%Y-%m-%d}"
 
+def hourly_quota_reset_in() -> timedelta:
+    """Time until the hourly quota bucket rolls over."""
     now = datetime.now()
-    session = user.get("hourly_request_session", {})
-
-    # Retrieve session data or set defaults.
-    first_request_time = session.get("first_request_time", now)
-    question_count = session.get("question_count", 0)
-
-    # If it's been more than an hour, reset the session.
-    if now - first_request_time >= timedelta(hours=1):
-        await users_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"hourly_request_session": {
-                "first_request_time": now,
-                "question_count": 0
-            }}}
-        )
-        return True, None  # User can request more questions
+    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return timedelta(seconds=int((next_hour - now).total_seconds()))
+
+async def consume_question_quota(user_id: int, count: int, hourly: bool = False) -> tuple[bool, int]:
+    """Atomically check and spend `count` questions from the user's quota.
+
+    Counters live in `quotas`, one document per user and day (or clock hour
+    for unlimited users), so a new day needs no reset and old buckets expire
+    through a TTL index. The limit is part of the update filter: when it
+    would be exceeded the upsert collides with the existing bucket and
+    nothing is spent. Returns (allowed, questions used in the bucket).
+    """
+    key = question_quota_bucket(user_id, hourly)
+    if hourly:
+        limit = {"$lt": HOURLY_QUESTION_LIMIT}  # Unlimited users may start a request below the hourly cap
+    else:
+        limit = {"$lte": DAILY_QUESTION_LIMIT - count}
 
-    # If the user has requested 60 questions within the hour, deny further requests.
-    if question_count >= 60:
-        next_available_time = first_request_time + timedelta(hours=1)
-        wait_time = next_available_time - now
-        return False, f"⏳ You've reached your limit of 60 questions this hour. Please try again in {wait_time}."
+    for attempt in range(2):
+        try:
+            bucket = await quotas_collection.find_one_and_update(
+                {"_id": key, "count": limit},
+                {
+                    "$inc": {"count": count},
+                    "$setOnInsert": {"user_id": user_id, "expires_at": datetime.utcnow() + timedelta(days=2)}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return True, bucket["count"]
+        except DuplicateKeyError:
+            pass  # Over the limit, or a concurrent request created the bucket first; re-check once
 
-    # User can still request more questions within the hour.
-    return True, None
+    bucket = await quotas_collection.find_one({"_id": key}, {"count": 1})
+    return False, bucket["count"] if bucket else 0
 
-async def update_hourly_request_count(user_id: int, additional_count: int):
-    """Update the user's hourly request count."""
-    user = await users_collection.find_one({"user_id": user_id})
-    session = user.get("hourly_request_session", {})
+async def refund_question_quota(user_id: int, count: int, hourly: bool = False):
+    """Give back questions that were reserved but never sent."""
+    await quotas_collection.update_one(
+        {"_id": question_quota_bucket(user_id, hourly)}, {"$inc": {"count": -count}}
+    )
 
-    # Update the question count in the session.
-    new_count = session.get("question_count", 0) + additional_count
+LEADERBOARD_VIEWS = {"daily": "daily_score", "monthly": "monthly_score", "alltime": "total_score"}
 
-    await users_collection.update_one(
-        {"user_id": user_id},
-        {"$set": {"hourly_request_session.question_count": new_count}}
+def leaderboard_keyboard():
+    """Buttons to switch between leaderboard views."""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[
+            InlineKeyboardButton(text="Daily", callback_data="leaderboard:daily"),
+            InlineKeyboardButton(text="Monthly", callback_data="leaderboard:monthly"),
+            InlineKeyboardButton(text="All-Time", callback_data="leaderboard:alltime")
+        ]]
     )
 
-
-@dp.message(Command("leaderboard"))
-async def leaderboard(message: types.Message):
-    """Display the daily top 10 leaderboard."""
+async def send_leaderboard(message: types.Message, user_id: int, view: str):
+    """Send a leaderboard view followed by the caller's own rank."""
     try:
-        # Fetch the top 10 users based on daily scores
-        daily_leaderboard = await users_collection.find().sort("daily_score", -1).limit(10).to_list(length=None)
-
-        # Build the leaderboard message
-        leaderboard_message = "🏆 *Daily Top 10 Performers* 🏆\n\n"
-        leaderboard_message += format_leaderboard_entries(daily_leaderboard, "daily_score")
+        # The top 10 is maintained in memory and its text is cached until the ranking changes
+        period = leaderboards.periods[LEADERBOARD_VIEWS[view]]
+        leaderboard_message = period.render() + period.render_rank(user_id)
 
         # Send the formatted leaderboard message
-        await message.answer(leaderboard_message, parse_mode="MarkdownV2")
+        await message.answer(leaderboard_message, parse_mode="MarkdownV2", reply_markup=leaderboard_keyboard())
 
     except Exception as e:
         logging.error(f"Error generating leaderboard: {e}")
         await message.answer("❌ An error occurred while generating the leaderboard. Please try again later.")
 
+@dp.message(Command("leaderboard"))
+async def leaderboard(message: types.Message):
+    """Display the top 10 leaderboard: /leaderboard [daily|monthly|alltime]."""
+    args = message.text.split()
+    view = args[1].lower().replace("-", "") if len(args) > 1 else "daily"
+    if view not in LEADERBOARD_VIEWS:
+        await message.reply("Usage: /leaderboard [daily|monthly|alltime]")
+        return
+    await send_leaderboard(message, message.from_user.id, view)
+
+@dp.callback_query(F.data.startswith("leaderboard:"))
+async def handle_leaderboard_view(call: types.CallbackQuery):
+    """Switch the leaderboard view from the inline buttons."""
+    view = call.data.split(":", 1)[1]
+    if view in LEADERBOARD_VIEWS:
+        await send_leaderboard(call.message, call.from_user.id, view)
+    await call.answer()
+
 def format_leaderboard_entries(users, score_field):
     """Format leaderboard entries into a readable string."""
     entries = ""
@@ -910,11 +1655,184 @@ def escape_markdown(text: str) -> str:
 
 
 
-async def reset_daily_scores():
-    """Reset daily scores at midnight."""
-    await users_collection.update_many({}, {"$set": {"daily_score": 0}})
-    logging.info("✅ Daily scores reset successfully.")
+class ScoreRanks:
+    """Order-statistic index of users by score for O(log n) rank lookups.
+
+    A Fenwick tree counts users per integer score, so the number of users
+    ahead of a score is a prefix sum; it grows by doubling when a score
+    exceeds its range. Only users with a positive score are tracked.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.scores = {}  # user_id -> score
+        self.tree = [0] * (capacity + 1)
+
+    def _add(self, score: int, delta: int):
+        index = score + 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def _count_at_most(self, score: int) -> int:
+        index = min(score + 1, len(self.tree) - 1)
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def _grow(self, score: int):
+        capacity = len(self.tree) - 1
+        while capacity <= score:
+            capacity *= 2
+        self.tree = [0] * (capacity + 1)
+        for existing in self.scores.values():
+            self._add(existing, 1)
+
+    def set(self, user_id: int, score: int):
+        score = int(score)
+        previous = self.scores.pop(user_id, None)
+        if previous is not None:
+            self._add(previous, -1)
+        if score <= 0:
+            return
+        if score >= len(self.tree) - 1:
+            self._grow(score)
+        self.scores[user_id] = score
+        self._add(score, 1)
+
+    def rank(self, user_id: int):
+        """Return (rank, score), or None if the user has no score."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return len(self.scores) - self._count_at_most(score) + 1, score
+
+    def load(self, scores: dict):
+        self.scores = {user_id: int(score) for user_id, score in scores.items() if score and score > 0}
+        self.tree = [0] * 2
+        self._grow(max(self.scores.values(), default=0))
+
+    def clear(self):
+        self.load({})
+
+
+class PeriodLeaderboard:
+    """Top-K users for one score field, maintained incrementally in memory.
+
+    Scores only grow between resets, so each increment can only move the
+    scoring user up: it is merged into the current top list and the
+    rendered MarkdownV2 text is dropped only when the list actually changes.
+    """
+
+    def __init__(self, score_field: str, title: str, size: int = LEADERBOARD_SIZE):
+        self.score_field = score_field
+        self.title = title
+        self.size = size
+        self.top = []  # [{"user_id", "username", score_field}], best first
+        self.ranks = ScoreRanks()
+        self.text = None
+
+    async def rebuild(self):
+        """Reload the top list with an indexed, projected query."""
+        projection = {"_id": 0, "user_id": 1, "username": 1, self.score_field: 1}
+        self.top = await users_collection.find(
+            {self.score_field: {"$gt": 0}}, projection
+        ).sort(self.score_field, -1).limit(self.size).to_list(length=self.size)
+        self.text = None
+
+    def update(self, user: dict):
+        """Merge a user's new score into the rank index and the top list."""
+        score = user.get(self.score_field, 0)
+        self.ranks.set(user["user_id"], score)
+        entries = [entry for entry in self.top if entry["user_id"] != user["user_id"]]
+        if len(entries) == len(self.top) and len(entries) >= self.size and score <= entries[-1][self.score_field]:
+            return  # Not in the top list and not good enough to enter it
+
+        entries.append({"user_id": user["user_id"], "username": user.get("username", "Unknown"), self.score_field: score})
+        entries.sort(key=lambda entry: entry[self.score_field], reverse=True)
+        entries = entries[:self.size]
+        if entries != self.top:
+            self.top = entries
+            self.text = None
+
+    def reset(self):
+        self.top = []
+        self.ranks.clear()
+        self.text = None
+
+    def render(self) -> str:
+        if self.text is None:
+            self.text = f"🏆 *{escape_markdown(self.title)} Top {self.size} Performers* 🏆\n\n"
+            self.text += format_leaderboard_entries(self.top, self.score_field)
+        return self.text
+
+    def render_rank(self, user_id: int) -> str:
+        """MarkdownV2 line with the user's own rank in this period."""
+        position = self.ranks.rank(user_id)
+        if position is None:
+            return "\n👤 You haven't scored yet in this period\\."
+        rank, score = position
+        return f"\n👤 Your rank: {rank} of {len(self.ranks.scores)} \\- {score} points"
+
+
+class Leaderboards:
+    """Daily, monthly and all-time leaderboards fed by `store_and_show_result`."""
+
+    SCORE_FIELDS = ("daily_score", "monthly_score", "total_score")
+
+    def __init__(self):
+        self.periods = {
+            "daily_score": PeriodLeaderboard("daily_score", "Daily"),
+            "monthly_score": PeriodLeaderboard("monthly_score", "Monthly"),
+            "total_score": PeriodLeaderboard("total_score", "All-Time"),
+        }
+
+    def record(self, user: dict):
+        """Apply a user document returned after a score increment."""
+        for period in self.periods.values():
+            period.update(user)
+
+    def reset(self, score_field: str):
+        self.periods[score_field].reset()
+
+    async def reload(self, score_field: str):
+        """Reload one period from MongoDB, e.g. once its scores have been reset."""
+        period = self.periods[score_field]
+        cursor = users_collection.find({score_field: {"$gt": 0}}, {"_id": 0, "user_id": 1, score_field: 1})
+        scores = {user["user_id"]: user[score_field] async for user in cursor}
+        await period.rebuild()
+        period.ranks.load(scores)
+
+    async def rebuild(self):
+        """Reload the top lists and, with one projected scan, every user's scores."""
+        for period in self.periods.values():
+            await period.rebuild()
+
+        scores = {field: {} for field in self.SCORE_FIELDS}
+        cursor = users_collection.find(
+            {"$or": [{field: {"$gt": 0}} for field in self.SCORE_FIELDS]},
+            {"_id": 0, "user_id": 1, **{field: 1 for field in self.SCORE_FIELDS}}
+        )
+        async for user in cursor:
+            for field in self.SCORE_FIELDS:
+                scores[field][user["user_id"]] = user.get(field, 0)
+        for field, period in self.periods.items():
+            period.ranks.load(scores[field])
+
+    async def run(self):
+        """Build on startup, then resync periodically to pick up other workers' scores."""
+        while True:
+            try:
+                await self.rebuild()
+            except PyMongoError as e:
+                logging.error(f"Error rebuilding leaderboards: {e}")
+            if not LEADERBOARD_REBUILD_INTERVAL:
+                return
+            await asyncio.sleep(LEADERBOARD_REBUILD_INTERVAL)
+
 
+leaderboards = Leaderboards()
 
 
 
@@ -923,124 +1841,628 @@ def normalize_category(category: str) -> str:
     """Normalize the category by converting to lowercase and replacing spaces with dashes."""
     return category.strip().lower().replace(" ", "-")
 
-async def fetch_questions_by_category(category: str):
-    """Fetch questions from the database by category."""
+class QuestionBank:
+    """In-process cache of the question bank.
+
+    Compact `_id` indexes keyed by normalized category and by (year, month, day)
+    are preloaded for the whole collection, so quiz selection never touches
+    MongoDB. Full question documents are loaded on demand and kept in an LRU
+    bounded by `max_documents`. The indexes follow the collection through a
+    change stream, or, when change streams are unavailable (standalone
+    mongod), through a periodic projected rescan that also drops cached
+    documents, so edits and deletions are picked up too.
+    """
+
+    INDEX_PROJECTION = {"category": 1, "year": 1, "month": 1, "day": 1}
+    DOCUMENT_PROJECTION = {"languages": 1, "correct_answers": 1}  # All languages: cached documents serve every user
+
+    def __init__(self, collection, max_documents: int = QUESTION_CACHE_SIZE,
+                 refresh_interval: int = QUESTION_REFRESH_INTERVAL):
+        self.collection = collection
+        self.max_documents = max_documents
+        self.refresh_interval = refresh_interval
+        self.by_category = {}  # normalized category -> [_id, ...]
+        self.by_date = {}  # (year, month, day) -> [_id, ...]
+        self.locations = {}  # _id -> (category, date key) for unindexing
+        self.documents = OrderedDict()  # _id -> full document, in LRU order
+        self.last_id = None
+        self.loaded = False
+
+    def _index(self, record):
+        """Add a compact question record to the category and date indexes."""
+        question_id = record["_id"]
+        self._unindex(question_id)
+
+        category = record.get("category")
+        date_key = None
+        if category:
+            self.by_category.setdefault(category, []).append(question_id)
+        if all(record.get(field) is not None for field in ("year", "month", "day")):
+            date_key = (int(record["year"]), int(record["month"]), int(record["day"]))
+            self.by_date.setdefault(date_key, []).append(question_id)
+
+        self.locations[question_id] = (category, date_key)
+        if self.last_id is None or question_id > self.last_id:
+            self.last_id = question_id
+
+    def _unindex(self, question_id):
+        """Remove a question from the indexes and the document cache."""
+        self.documents.pop(question_id, None)
+        location = self.locations.pop(question_id, None)
+        if not location:
+            return
+
+        category, date_key = location
+        for index, key in ((self.by_category, category), (self.by_date, date_key)):
+            ids = index.get(key)
+            if ids and question_id in ids:
+                ids.remove(question_id)
+                if not ids:
+                    del index[key]
+
+    def _remember(self, document):
+        """Cache a full question document, evicting the least recently used ones."""
+        self.documents[document["_id"]] = document
+        self.documents.move_to_end(document["_id"])
+        while len(self.documents) > self.max_documents:
+            self.documents.popitem(last=False)
+
+    async def reindex(self):
+        """Rebuild the indexes from a single projected scan and empty the document cache."""
+        records = await self.collection.find({}, self.INDEX_PROJECTION).sort("_id", 1).to_list(length=None)
+        # Swap in one step (no await below) so concurrent quizzes never see a half-built index.
+        self.by_category, self.by_date, self.locations = {}, {}, {}
+        self.documents.clear()
+        self.last_id = None
+        for record in records:
+            self._index(record)
+
+    async def load(self):
+        """Build the indexes for the whole collection."""
+        await self.reindex()
+        self.loaded = True
+        logging.info(f"Question bank loaded: {len(self.locations)} questions indexed.")
+
+    async def refresh(self):
+        """Index questions inserted since the last scan (catch-up before watching)."""
+        query = {"_id": {"$gt": self.last_id}} if self.last_id is not None else {}
+        cursor = self.collection.find(query, self.INDEX_PROJECTION).sort("_id", 1)
+        async for record in cursor:
+            self._index(record)
+
+    async def watch(self):
+        """Apply inserts, updates and deletes from the polls change stream."""
+        # Only the indexed fields of changed documents are shipped with each event.
+        pipeline = [{"$project": {
+            "operationType": 1, "documentKey": 1, "fullDocument._id": 1,
+            **{f"fullDocument.{field}": 1 for field in self.INDEX_PROJECTION}
+        }}]
+        async with self.collection.watch(pipeline, full_document="updateLookup") as stream:
+            async for change in stream:
+                question_id = change["documentKey"]["_id"]
+                document = change.get("fullDocument")
+                if change["operationType"] == "delete" or document is None:
+                    self._unindex(question_id)
+                else:
+                    self._index(document)
+
+    async def run(self):
+        """Load the bank, then keep it in sync for the lifetime of the bot."""
+        while not self.loaded:
+            try:
+                await self.load()
+            except PyMongoError as e:
+                logging.error(f"Failed to load question bank: {e}")
+                await asyncio.sleep(self.refresh_interval)
+
+        use_change_stream = True
+        while True:
+            try:
+                if use_change_stream:
+                    await self.refresh()  # Catch up on anything missed before (re)watching
+                    await self.watch()
+                else:
+                    await asyncio.sleep(self.refresh_interval)
+                    await self.reindex()  # An `_id` delta scan would miss edits and deletions
+            except OperationFailure as e:
+                # Change streams need a replica set; fall back to periodic rescans.
+                logging.info(f"Change streams unavailable ({e}); using periodic rescans.")
+                use_change_stream = False
+            except PyMongoError as e:
+                logging.error(f"Error refreshing question bank: {e}")
+                await asyncio.sleep(self.refresh_interval)
+
+    def sample_ids(self, key, count: int):
+        """Pick up to `count` random question IDs for a category or date key."""
+        index = self.by_date if isinstance(key, tuple) else self.by_category
+        ids = index.get(key, [])
+        return random.sample(ids, min(count, len(ids)))
+
+    async def get_many(self, question_ids):
+        """Return full documents for the given IDs, fetching misses in one query."""
+        missing = [question_id for question_id in question_ids if question_id not in self.documents]
+        if missing:
+            async for document in self.collection.find({"_id": {"$in": missing}}, self.DOCUMENT_PROJECTION):
+                self._remember(document)
+
+        documents = []
+        for question_id in question_ids:
+            document = self.documents.get(question_id)
+            if document is not None:
+                self.documents.move_to_end(question_id)
+                documents.append(document)
+        return documents
+
+    async def get(self, question_id):
+        """Return a single full question document, or None if it does not exist."""
+        documents = await self.get_many([question_id])
+        return documents[0] if documents else None
+
+
+question_bank = QuestionBank(polls_collection)
+
+def question_projection(language: str) -> dict:
+    """Project only the question fields needed to quiz in the given language."""
+    return {f"languages.{language}": 1, f"correct_answers.{language}": 1}
+
+async def sample_questions(query: dict, count: int, language: str):
+    """Return up to `count` random questions matching the query.
+
+    Sampling runs server-side with `$sample`, so only the selected documents
+    (projected to one language) are sent over the wire. When fewer than
+    `count` questions match, all of them are returned in random order.
+    """
+    pipeline = [
+        {"$match": query},
+        {"$sample": {"size": count}},
+        {"$project": question_projection(language)},
+    ]
+    return await polls_collection.aggregate(pipeline).to_list(length=count)
+
+async def fetch_questions_by_category(category: str, count: int, language: str):
+    """Fetch up to `count` random questions from the database by category."""
     normalized_category = normalize_category(category)  # Ensure proper normalization
+    if question_bank.loaded:
+        return await question_bank.get_many(question_bank.sample_ids(normalized_category, count))
+
     query = {"category": normalized_category}  # Query with normalized category
-    questions = await polls_collection.find(query).to_list(length=None)
-    return questions
+    return await sample_questions(query, count, language)
 
 
-async def fetch_questions_by_date(year, month, day):
-    """Fetch questions from the database by a specific date."""
-    query = {"year": int(year), "month": int(month), "day": int(day)}
-    return await polls_collection.find(query).to_list(length=None)
+async def fetch_questions_by_date(year, month, day, count: int, language: str):
+    """Fetch up to `count` random questions from the database by a specific date."""
+    date_key = (int(year), int(month), int(day))
+    if question_bank.loaded:
+        return await question_bank.get_many(question_bank.sample_ids(date_key, count))
+
+    query = {"year": date_key[0], "month": date_key[1], "day": date_key[2]}
+    return await sample_questions(query, count, language)
 
 async def get_user_daily_questions(user_id: int) -> int:
-    """Ensure the daily questions are correctly tracked and reset if it's a new day."""
-    today = datetime.now().date()
+    """Return how many questions the user has requested today."""
+    bucket = await quotas_collection.find_one({"_id": question_quota_bucket(user_id, hourly=False)}, {"count": 1})
+    return bucket["count"] if bucket else 0
 
-    # Use MongoDB's find_one_and_update to handle upserts efficiently
-    user = await users_collection.find_one_and_update(
-        {"user_id": user_id},
-        {
-            "$setOnInsert": {"last_request_date": str(today), "daily_questions": 0},  # Initialize on first insert
-        },
-        upsert=True,
-        return_document=True  # Return the updated or inserted document
-    )
 
-    # If it's a new day, reset daily questions and last request date
-    if user.get("last_request_date") != str(today):
-        await users_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"last_request_date": str(today), "daily_questions": 0}}
-        )
-        return 0  # New day, so start with 0 daily questions
+class Entitlement(NamedTuple):
+    """A user's unlimited-access plan as stored on the user document."""
+    unlimited_access: bool
+    expiry_date: datetime | None
 
-    # Return the current count of daily questions
-    return user.get("daily_questions", 0)
+    def is_active(self, now: datetime) -> bool:
+        return self.unlimited_access and (self.expiry_date is None or now <= self.expiry_date)
 
 
-async def update_user_daily_questions(user_id: int, additional_count: int):
-    """Increment the user's daily question count correctly."""
-    today = datetime.now().date()
+class EntitlementCache:
+    """Short-TTL cache of unlimited-access plans keyed by user_id.
 
-    # Fetch the current user data
-    user = await users_collection.find_one({"user_id": user_id})
-    current_count = 0
+    Plans only change through /grant_access, /revoke_access or expiry, so the
+    expiry timestamp is cached and evaluated locally. The admin handlers
+    invalidate entries explicitly; the TTL bounds staleness when another
+    worker makes the change.
+    """
 
-    if user and user.get("last_request_date") == str(today):
-        current_count = user.get("daily_questions", 0)
+    PROJECTION = {"unlimited_access": 1, "unlimited_access_expiry": 1}
 
-    # Calculate the new count, ensuring it stays non-negative
-    new_count = max(0, current_count + additional_count)
+    def __init__(self, ttl: float = ENTITLEMENT_CACHE_TTL, max_entries: int = ENTITLEMENT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # user_id -> (Entitlement, expires_at)
 
-    # Update the user's daily question count in the database
-    await users_collection.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "last_request_date": str(today),
-                "daily_questions": new_count
-            }
-        },
-        upsert=True  # Insert if the user does not exist
-    )
+    def remember(self, user_id: int, user):
+        """Cache the plan from a user document (or None for an unknown user)."""
+        user = user or {}
+        entitlement = Entitlement(bool(user.get("unlimited_access")), user.get("unlimited_access_expiry"))
+        self.entries[user_id] = (entitlement, time.monotonic() + self.ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entitlement
+
+    def invalidate(self, user_id: int):
+        self.entries.pop(user_id, None)
 
+    async def get(self, user_id: int) -> Entitlement:
+        cached = self.entries.get(user_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        user = await users_collection.find_one({"user_id": user_id}, self.PROJECTION)
+        return self.remember(user_id, user)
 
 
+entitlement_cache = EntitlementCache()
+
 async def has_valid_unlimited_access(user_id: int) -> bool:
     """Check if the user has valid unlimited access."""
-    user = await users_collection.find_one({"user_id": user_id})
+    entitlement = await entitlement_cache.get(user_id)
 
-    if not user or not user.get("unlimited_access"):
+    if not entitlement.unlimited_access:
         return False
 
-    expiry_date = user.get("unlimited_access_expiry")
-    if expiry_date and datetime.now() > expiry_date:
+    if not entitlement.is_active(datetime.now()):
         # Revoke unlimited access if it expired
         await users_collection.update_one(
             {"user_id": user_id},
             {"$unset": {"unlimited_access": "", "unlimited_access_expiry": ""}}
         )
+        entitlement_cache.remember(user_id, None)
         return False
 
     return True
 
 
 
+### Poll Tracking ###
+
+class TrackedPoll(NamedTuple):
+    """Compact record of a sent quiz poll."""
+    correct_option_id: int
+    user_id: int
+    session_id: str
+    expires_at: float  # time.monotonic() deadline for the in-memory tier
+
+
+class PollTracker:
+    """Map poll_id to its correct option, bounded in memory and persisted in MongoDB.
+
+    Recent polls live in an insertion-ordered dict that evicts expired and
+    excess entries from the oldest end. Every poll is also written, in
+    batches, to a collection with a TTL index, so answers arriving after an
+    eviction or a restart are still scored.
+    """
+
+    def __init__(self, collection, ttl: int = POLL_TRACKING_TTL, max_entries: int = POLL_TRACKING_MAX_ENTRIES,
+                 flush_interval: float = POLL_TRACKING_FLUSH_INTERVAL, batch_size: int = 500):
+        self.collection = collection
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.entries = OrderedDict()  # poll_id -> TrackedPoll, oldest first
+        self.pending = []  # Documents waiting for the next batched insert
+        self.flush_now = asyncio.Event()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if len(self.entries) <= self.max_entries and oldest.expires_at > now:
+                break
+            self.entries.popitem(last=False)
+
+    def track(self, poll_id: str, correct_option_id: int, user_id: int, session_id: str):
+        """Remember a sent poll; the MongoDB write happens in the next batch."""
+        self.entries[poll_id] = TrackedPoll(correct_option_id, user_id, session_id, time.monotonic() + self.ttl)
+        self._evict()
+
+        self.pending.append({
+            "_id": poll_id,
+            "correct_option_id": correct_option_id,
+            "user_id": user_id,
+            "session_id": session_id,
+            "created_at": datetime.utcnow()  # TTL indexes compare against UTC
+        })
+        if len(self.pending) >= self.batch_size:
+            self.flush_now.set()
+
+    async def get(self, poll_id: str):
+        """Return the TrackedPoll for `poll_id`, falling back to MongoDB on a memory miss."""
+        entry = self.entries.get(poll_id)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry
+
+        document = await self.collection.find_one(
+            {"_id": poll_id}, {"_id": 0, "correct_option_id": 1, "user_id": 1, "session_id": 1}
+        )
+        if not document:
+            return None
+        return TrackedPoll(document["correct_option_id"], document["user_id"], document["session_id"], 0.0)
+
+    def discard(self, poll_id: str):
+        """Drop an answered poll from memory; MongoDB keeps it until the TTL expires."""
+        self.entries.pop(poll_id, None)
+
+    async def flush(self):
+        """Write pending polls to MongoDB in one batch."""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except PyMongoError as e:
+            logging.error(f"Failed to persist {len(batch)} tracked polls: {e}")
+
+    async def run(self):
+        """Flush pending polls every `flush_interval` seconds or when a batch fills up."""
+        await self.ensure_indexes()
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_now.clear()
+            await self.flush()
+
+
+poll_tracker = PollTracker(db["poll_tracking"])
+
+### Session Write-Behind ###
+
+# Session fields read by store_and_show_result (answered_polls and deadline are not needed).
+SESSION_RESULT_PROJECTION = {
+    "_id": 0, "session_id": 1, "question_ids": 1, "correct_questions": 1, "answered": 1,
+    "sent": 1, "finalized": 1, "selected_language": 1, "question_summaries": 1
+}
+
+class BufferedSession:
+    """Answers recorded in memory for one quiz session."""
+    __slots__ = ("user_id", "session_id", "sent", "answered_polls", "correct_questions", "dirty")
+
+    def __init__(self, user_id: int, session_id: str, sent: int, answered_polls=(), correct_questions=()):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.sent = sent
+        self.answered_polls = set(answered_polls)
+        self.correct_questions = set(correct_questions)
+        self.dirty = False
+
+    @property
+    def complete(self) -> bool:
+        return len(self.answered_polls) >= self.sent
+
+
+def session_answers_update(answered_polls, correct_questions, finalize: bool = False):
+    """Pipeline update merging answers into a session document.
+
+    The merge is a set union and `answered` is derived from `answered_polls`,
+    so applying the same answers twice (e.g. on journal replay) is harmless.
+    """
+    stages = [
+        {"$set": {
+            "answered_polls": {"$setUnion": [{"$ifNull": ["$answered_polls", []]}, list(answered_polls)]},
+            "correct_questions": {"$setUnion": [{"$ifNull": ["$correct_questions", []]}, list(correct_questions)]}
+        }},
+        {"$set": {"answered": {"$size": "$answered_polls"}}}
+    ]
+    if finalize:
+        stages.append({"$set": {"finalized": True}})
+    return stages
+
+
+class SessionWriteBehind:
+    """Write-behind buffer for per-answer updates to `user_sessions`.
+
+    Answers are kept in memory per session_id and written with `bulk_write`
+    every `flush_interval` seconds or once `batch_size` answers are pending.
+    Finalizing a session flushes it immediately. Each answer is appended to a
+    local journal before it is acknowledged; the journal is rotated at every
+    flush and deleted once the flush succeeds, and anything left on disk is
+    replayed on startup.
+    """
+
+    def __init__(self, collection, journal_path: str = SESSION_JOURNAL_PATH,
+                 flush_interval: float = SESSION_FLUSH_INTERVAL, batch_size: int = SESSION_FLUSH_BATCH):
+        self.collection = collection
+        self.journal_path = journal_path
+        self.flushing_path = journal_path + ".flushing"
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sessions = {}  # session_id -> BufferedSession
+        self.pending = 0
+        self.flush_now = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.journal = None
+
+    def _append_journal(self, record: dict):
+        if self.journal is None:
+            self.journal = open(self.journal_path, "a", encoding="utf-8")
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+
+    def discard(self, session_id: str):
+        """Forget a session whose document was replaced by a new quiz."""
+        self.sessions.pop(session_id, None)
+
+    async def record_answer(self, user_id: int, session_id: str, poll_id: str, is_correct: bool):
+        """Buffer one answer; return the session state, or None if it is not active."""
+        state = self.sessions.get(session_id)
+        if state is None:
+            document = await self.collection.find_one(
+                {"user_id": user_id, "session_id": session_id, "finalized": {"$ne": True}},
+                {"sent": 1, "answered_polls": 1, "correct_questions": 1}
+            )
+            if not document:
+                return None
+            state = BufferedSession(
+                user_id, session_id, document.get("sent", 0),
+                document.get("answered_polls", []), document.get("correct_questions", [])
+            )
+            self.sessions[session_id] = state
+
+        if poll_id in state.answered_polls:
+            return state
+
+        self._append_journal({"user_id": user_id, "session_id": session_id, "poll_id": poll_id, "correct": is_correct})
+        state.answered_polls.add(poll_id)
+        if is_correct:
+            state.correct_questions.add(poll_id)
+        state.dirty = True
+
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush_now.set()
+        return state
+
+    async def finalize(self, user_id: int, session_id=None):
+        """Flush a session's buffered answers and mark it finalized in one update.
+
+        Returns the finalized document only to the first caller, like
+        `claim_session_result`.
+        """
+        state = self.sessions.pop(session_id, None) if session_id else None
+        query = {"user_id": user_id, "finalized": {"$ne": True}}
+        if session_id:
+            query["session_id"] = session_id
+
+        answered_polls = state.answered_polls if state else ()
+        correct_questions = state.correct_questions if state else ()
+        return await self.collection.find_one_and_update(
+            query, session_answers_update(answered_polls, correct_questions, finalize=True),
+            projection=SESSION_RESULT_PROJECTION, return_document=ReturnDocument.AFTER
+        )
+
+    async def flush(self):
+        """Write every dirty session in one `bulk_write`."""
+        async with self.flush_lock:
+            dirty = [state for state in self.sessions.values() if state.dirty]
+            if not dirty:
+                return
+
+            # Answers arriving during the write go to a fresh journal file.
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if os.path.exists(self.journal_path):
+                if os.path.exists(self.flushing_path):
+                    # A previous flush failed; keep its records alongside the new ones.
+                    with open(self.flushing_path, "a", encoding="utf-8") as target, \
+                            open(self.journal_path, encoding="utf-8") as source:
+                        target.write(source.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.flushing_path)
+
+            operations = []
+            for state in dirty:
+                state.dirty = False
+                operations.append(UpdateOne(
+                    {"session_id": state.session_id},
+                    session_answers_update(state.answered_polls, state.correct_questions)
+                ))
+            self.pending = 0
+
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except PyMongoError as e:
+                logging.error(f"Failed to flush {len(operations)} buffered sessions: {e}")
+                for state in dirty:
+                    state.dirty = True
+                return
+            if os.path.exists(self.flushing_path):
+                os.remove(self.flushing_path)
+
+    async def replay(self):
+        """Apply answers journaled before a crash, then discard the journals."""
+        sessions = {}
+        for path in (self.flushing_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn final line from the crash
+                    answered, correct = sessions.setdefault(record["session_id"], (set(), set()))
+                    answered.add(record["poll_id"])
+                    if record["correct"]:
+                        correct.add(record["poll_id"])
+
+        if sessions:
+            await self.collection.bulk_write([
+                UpdateOne({"session_id": session_id}, session_answers_update(answered, correct))
+                for session_id, (answered, correct) in sessions.items()
+            ], ordered=False)
+            logging.info(f"Replayed journaled answers for {len(sessions)} sessions.")
+
+        for path in (self.flushing_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def run(self):
+        """Flush every `flush_interval` seconds or when enough answers are pending."""
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_now.clear()
+            await self.flush()
+
+
+session_buffer = SessionWriteBehind(db["user_sessions"]) if SESSION_WRITE_BEHIND else None
+
 async def send_quiz(message, questions, requested_count, language):
-    """Send quiz questions to the user."""
+    """Send quiz questions to the user.
+
+    `questions` are the documents selected by `fetch_questions_by_category_or_date`
+    (at least the `language` projection), so sending needs no further question reads.
+    """
     user_id = message.from_user.id
     chat_id = message.chat.id
     question_ids = [q['_id'] for q in questions]
+    question_summaries = [question_summary(q, language) for q in questions]
 
     # Generate a unique session ID for this quiz session
     session_id = str(uuid.uuid4())
 
-    # Calculate the dynamic timeout duration (30 seconds per question)
+    # Calculate the dynamic timeout deadline (30 seconds per question)
     timeout_duration = requested_count * 30  # e.g., 15 questions -> 450 seconds
+    deadline = datetime.now() + timedelta(seconds=timeout_duration)
 
-    # Store the session in the database
-    await db["user_sessions"].update_one(
+    # Store the session in the database, replacing the user's previous quiz if any
+    previous = await db["user_sessions"].find_one_and_update(
         {"user_id": user_id},
         {
             "$set": {
                 "session_id": session_id,
+                "chat_id": chat_id,
+                "deadline": deadline,
                 "question_ids": question_ids,
                 "answered": 0,
                 "sent": requested_count,
+                "finalized": False,
                 "correct_questions": [],
-                "selected_language": language
+                "answered_polls": [],
+                "selected_language": language,
+                "question_summaries": question_summaries  # Snapshot for result rendering
             }
         },
+        projection={"_id": 0, "session_id": 1},
         upsert=True
     )
-
-    # Function to send each poll question
-    async def send_poll(question_id):
-        question = await polls_collection.find_one({"_id": question_id})
+    previous_session_id = previous.get("session_id") if previous else None
+    if previous_session_id and previous_session_id != session_id:
+        # The replaced quiz can no longer be answered or time out; forget its in-memory state.
+        quiz_timeouts.cancel(previous_session_id)
+        if session_buffer:
+            session_buffer.discard(previous_session_id)
+
+    # Function to send each poll question from its already-loaded document
+    async def send_poll(question):
         lang_data = question['languages'][language]
         correct_option_id = question['correct_answers'][language]
 
@@ -1053,15 +2475,15 @@ async def send_quiz(message, questions, requested_count, language):
                 correct_option_id=correct_option_id,
                 is_anonymous=False
             )
-            poll_tracking[poll.poll.id] = correct_option_id
+            poll_tracker.track(poll.poll.id, correct_option_id, user_id, session_id)
         except Exception as e:
             logging.error(f"Error sending poll: {e}")
 
     # Send all quiz questions concurrently
-    await asyncio.gather(*(send_poll(q) for q in question_ids))
+    await asyncio.gather(*(send_poll(q) for q in questions))
 
-    # Start the timeout task with the calculated duration
-    asyncio.create_task(check_quiz_timeout(user_id, session_id, chat_id, timeout_duration))
+    # Register the deadline with the central timeout scheduler
+    quiz_timeouts.schedule(session_id, deadline)
 
     await message.answer(f"✅ {requested_count} questions sent! Answer them quickly to avoid timeout And After answering all question you will get explnantions and your result will be uploadede to leaderboard.")
 
@@ -1072,38 +2494,77 @@ async def handle_poll_answer(poll_answer: PollAnswer):
     poll_id = poll_answer.poll_id
     selected_option = poll_answer.option_ids[0]
 
-    correct_option_id = poll_tracking.get(poll_id)
-    session = await db["user_sessions"].find_one({"user_id": user_id})
+    tracked_poll = await poll_tracker.get(poll_id)
+    correct_option_id = tracked_poll.correct_option_id if tracked_poll else None
+    poll_tracker.discard(poll_id)
+    is_correct = correct_option_id is not None and selected_option == correct_option_id
+
+    if session_buffer and tracked_poll:
+        state = await session_buffer.record_answer(user_id, tracked_poll.session_id, poll_id, is_correct)
+        if not state:
+            await bot.send_message(user_id, "❌ No active session found.")
+        elif state.complete:
+            session = await claim_session_result(user_id, state.session_id)
+            if session:
+                await store_and_show_result(user_id, poll_answer.user.id, session)
+        return
+
+    query = {"user_id": user_id, "finalized": {"$ne": True}}
+    if tracked_poll:
+        query["session_id"] = tracked_poll.session_id  # Ignore answers to polls from older sessions
+
+    # Record the answer, count it and flag completion in one atomic update. Only
+    # the answer that completes the session sees `finalized` flip to True here.
+    answer_update = {"answered": {"$add": [{"$ifNull": ["$answered", 0]}, 1]}}
+    if is_correct:
+        answer_update["correct_questions"] = {
+            "$setUnion": [{"$ifNull": ["$correct_questions", []]}, [poll_id]]
+        }
+    session = await db["user_sessions"].find_one_and_update(
+        query,
+        [
+            {"$set": answer_update},
+            {"$set": {"finalized": {"$gte": ["$answered", "$sent"]}}}
+        ],
+        projection=SESSION_RESULT_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
 
     if not session:
         await bot.send_message(user_id, "❌ No active session found.")
         return
 
-    answered = session.get("answered", 0)
-    sent = session.get("sent", 0)
+    if session.get("finalized"):
+        await store_and_show_result(user_id, poll_answer.user.id, session)
 
-    if correct_option_id is not None and selected_option == correct_option_id:
-        await db["user_sessions"].update_one(
-            {"user_id": user_id},
-            {"$addToSet": {"correct_questions": poll_id}}
-        )
+async def claim_session_result(user_id, session_id=None):
+    """Mark an unfinished session finalized; return it only to the first caller."""
+    if session_buffer:
+        return await session_buffer.finalize(user_id, session_id)
 
-    await db["user_sessions"].update_one(
-        {"user_id": user_id},
-        {"$inc": {"answered": 1}}
+    query = {"user_id": user_id, "finalized": {"$ne": True}}
+    if session_id:
+        query["session_id"] = session_id
+    return await db["user_sessions"].find_one_and_update(
+        query, {"$set": {"finalized": True}},
+        projection=SESSION_RESULT_PROJECTION, return_document=ReturnDocument.AFTER
     )
 
-    if answered + 1 >= sent:
-        await store_and_show_result(user_id, poll_answer.user.id)
+async def store_and_show_result(user_id, chat_id, session=None):
+    """Store the quiz result and display it to the user.
 
-async def store_and_show_result(user_id, chat_id):
-    """Store the quiz result and display it to the user."""
-    session = await db["user_sessions"].find_one({"user_id": user_id})
+    `session` is the finalized session document; callers get it from the
+    update that finalized it, which guarantees the result is stored once.
+    """
+    if session is None:
+        session = await claim_session_result(user_id)
 
     if not session:
         await bot.send_message(chat_id, "❌ No session found.")
         return
 
+    quiz_timeouts.cancel(session.get("session_id"))
+
     question_ids = session.get("question_ids", [])
     correct_answers_today = session.get("correct_questions", [])
     total_answered = session.get("answered", 0)
@@ -1111,17 +2572,17 @@ async def store_and_show_result(user_id, chat_id):
     score = len(correct_answers_today)
 
     selected_language = session.get("selected_language", "en")
-    explanations = []
-
-    for question_id in question_ids:
-        question = await polls_collection.find_one({"_id": question_id})
-        if question:
-            lang_data = question['languages'].get(selected_language, {})
-            explanation = (
-                f"Q: {lang_data.get('question', 'N/A')}\n"
-                f"Explanation: {lang_data.get('explanation', 'No explanation available.')}"
-            )
-            explanations.append(explanation)
+
+    # Sessions created by send_quiz carry a snapshot; older ones need one batched lookup.
+    summaries = session.get("question_summaries")
+    if summaries is None:
+        summaries = await fetch_question_summaries(question_ids, selected_language)
+
+    explanations = [
+        f"Q: {summary.get('question', 'N/A')}\n"
+        f"Explanation: {summary.get('explanation', 'No explanation available.')}"
+        for summary in summaries
+    ]
 
     explanation_text = "\n\n".join(explanations)
     result_message = (
@@ -1145,16 +2606,51 @@ async def store_and_show_result(user_id, chat_id):
     }
     await db["results"].insert_one(result)
 
-    await users_collection.update_one(
+    # Points from an earlier day or month are dropped in the same update, so a
+    # user scoring before the midnight reset reached them starts from zero.
+    today = score_day()
+    scored_on = {"$ifNull": ["$scored_on", today]}  # Unstamped documents count as current
+    user = await users_collection.find_one_and_update(
         {"user_id": user_id},
-        {
-            "$inc": {"daily_score": score, "monthly_score": score, "total_score": score},
-            "$set": {"last_result": result}
-        },
-        upsert=True
+        [{"$set": {
+            "daily_score": {"$add": [
+                {"$cond": [{"$eq": [scored_on, today]}, {"$ifNull": ["$daily_score", 0]}, 0]}, score
+            ]},
+            "monthly_score": {"$add": [
+                {"$cond": [{"$gte": [scored_on, today[:8] + "01"]}, {"$ifNull": ["$monthly_score", 0]}, 0]}, score
+            ]},
+            "total_score": {"$add": [{"$ifNull": ["$total_score", 0]}, score]},
+            "scored_on": today,
+            "last_result": {"$literal": result},
+        }}],
+        projection={"_id": 0, "user_id": 1, "username": 1, **{field: 1 for field in Leaderboards.SCORE_FIELDS}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
     )
+    leaderboards.record(user)
 
-    await db["user_sessions"].delete_one({"user_id": user_id})
+    await db["user_sessions"].delete_one({"user_id": user_id, "session_id": session.get("session_id")})
+
+def question_summary(question, language: str) -> dict:
+    """Extract the question text and explanation shown in the quiz summary."""
+    lang_data = question.get('languages', {}).get(language, {})
+    return {
+        "question": lang_data.get('question', 'N/A'),
+        "explanation": lang_data.get('explanation', 'No explanation available.')
+    }
+
+async def fetch_question_summaries(question_ids, language: str):
+    """Fetch question summaries in one `$in` query, ordered like `question_ids`."""
+    projection = {
+        f"languages.{language}.question": 1,
+        f"languages.{language}.explanation": 1
+    }
+    cursor = polls_collection.find({"_id": {"$in": question_ids}}, projection)
+    questions = {question["_id"]: question async for question in cursor}
+    return [
+        question_summary(questions[question_id], language)
+        for question_id in question_ids if question_id in questions
+    ]
 
 def chunk_text(text, max_length=4096):
     """Split long text into chunks within Telegram's message limit."""
@@ -1202,7 +2698,7 @@ async def get_user_id(target: str) -> int | None:
         return int(target)  # If it's already a user ID, return it as an integer
 
     # Try to find the user by username
-    user = await users_collection.find_one({"username": target})
+    user = await users_collection.find_one({"username": target}, {"_id": 0, "user_id": 1})
     if user:
         return user["user_id"]
     return None  # Return None if the user isn't found
@@ -1216,12 +2712,12 @@ async def grant_access(user_id: int, duration_days: int = 30):
         {
             "$set": {
                 "unlimited_access": True,
-                "unlimited_access_expiry": expiry_date,
-                "daily_questions": float('inf')
+                "unlimited_access_expiry": expiry_date
             }
         },
         upsert=True
     )
+    entitlement_cache.invalidate(user_id)
 
     # Notify the user
     try:
@@ -1253,14 +2749,12 @@ async def handle_revoke_access(message: types.Message):
         await message.reply("User not found.")
         return
 
-    # Revoke access and reset daily questions to 30
+    # Revoke access; the user falls back to the free daily quota
     await users_collection.update_one(
         {"user_id": user_id},
-        {
-            "$unset": {"unlimited_access": "", "unlimited_access_expiry": ""},
-            "$set": {"daily_questions": 30}
-        }
+        {"$unset": {"unlimited_access": "", "unlimited_access_expiry": ""}}
     )
+    entitlement_cache.invalidate(user_id)
 
     # Notify the user about the revocation
     try:
@@ -1283,26 +2777,60 @@ async def handle_reset_leaderboard(message: types.Message):
         return
 
     await users_collection.update_many({}, {"$set": {"total_score": 0}})
+    leaderboards.reset("total_score")
     await message.reply("Leaderboard has been reset.")
 
-async def reset_daily_scores():
-    """Reset daily scores at midnight."""
-    await users_collection.update_many({}, {"$set": {"daily_score": 0}})
-    logging.info("✅ Daily scores reset successfully.")
-
-
+def score_day(moment: datetime | None = None) -> str:
+    """The `scored_on` stamp for a moment: its local date as YYYY-MM-DD."""
+    return (moment or datetime.now()).strftime("%Y-%m-%d")
 
+async def reset_field_in_batches(field: str, before: str) -> int:
+    """Zero `field` on users last scored before the day `before`, in paced batches.
 
-async def reset_daily_questions():
-    """Reset daily questions for all users at midnight."""
-    await users_collection.update_many(
-        {"unlimited_access": {"$ne": True}},  # Reset only for non-unlimited users
-        {"$set": {"daily_questions": 0}}
-    )
-    logging.info("✅ Daily questions reset successfully.")
+    Only documents touched since the last reset match, and the pause between
+    batches keeps the write rate (and replication lag) bounded. Users who
+    scored on `before` or later already had their old points dropped by the
+    scoring update and are left alone. Returns the number of documents modified.
+    """
+    stale = {field: {"$gt": 0}, "$or": [{"scored_on": {"$lt": before}}, {"scored_on": {"$exists": False}}]}
+    touched = 0
+    while True:
+        batch = await users_collection.find(
+            stale, {"_id": 1}
+        ).limit(RESET_BATCH_SIZE).to_list(length=RESET_BATCH_SIZE)
+        if not batch:
+            return touched
+
+        # Re-check the filter: the user may have scored since the batch was read.
+        result = await users_collection.update_many(
+            {"_id": {"$in": [user["_id"] for user in batch]}, **stale},
+            {"$set": {field: 0}}
+        )
+        touched += result.modified_count
+        await asyncio.sleep(RESET_BATCH_PAUSE)
+
+async def reset_daily_scores(day: str | None = None):
+    """Reset daily scores at midnight, for the day `day` (default today) that just started."""
+    started = time.monotonic()
+    touched = await reset_field_in_batches("daily_score", day or score_day())
+    await leaderboards.reload("daily_score")  # After the batches, so it matches MongoDB
+    logging.info(f"✅ Daily scores reset: {touched} users updated in {time.monotonic() - started:.1f}s.")
+    return touched
+
+async def reset_monthly_scores(day: str | None = None):
+    """Reset monthly scores at the first midnight of a month."""
+    started = time.monotonic()
+    touched = await reset_field_in_batches("monthly_score", (day or score_day())[:8] + "01")
+    await leaderboards.reload("monthly_score")
+    logging.info(f"✅ Monthly scores reset: {touched} users updated in {time.monotonic() - started:.1f}s.")
+    return touched
 
 async def schedule_resets():
-    """Schedule daily resets for scores and questions at midnight."""
+    """Schedule the daily score reset at midnight, and the monthly one when a month starts.
+
+    Question quotas need no reset: their counters are keyed by day (or hour),
+    so a new day starts from zero by itself.
+    """
     while True:
         now = datetime.now()
         
@@ -1315,22 +2843,596 @@ async def schedule_resets():
         # Sleep until midnight
         await asyncio.sleep(seconds_until_midnight)
 
-        # Perform the resets
-        await reset_daily_questions()
-        await reset_daily_scores()
-        logging.info("✅ Daily questions and scores reset successfully.")
+        # Perform the reset
+        resets = [("daily_score", reset_daily_scores)]
+        if next_midnight.day == 1:
+            resets.append(("monthly_score", reset_monthly_scores))
+        for field, reset in resets:
+            try:
+                if WORKER_INDEX in (None, 0):
+                    await reset(score_day(next_midnight))  # The sleep may wake a moment early
+                else:
+                    # Worker 0 resets MongoDB; the others only their in-memory board. Scoring
+                    # already drops yesterday's points, so nothing recorded from now on is stale.
+                    leaderboards.reset(field)
+            except PyMongoError as e:
+                logging.error(f"Error resetting {field}: {e}")
+
+
+
+### Index Provisioning ###
+
+# Indexes the hot queries rely on, per collection. Unique constraints are left
+# out on purpose: existing duplicates would make index creation fail at startup.
+REQUIRED_INDEXES = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("username", ASCENDING)], name="username"),
+        IndexModel([("daily_score", DESCENDING)], name="daily_score"),
+        IndexModel([("monthly_score", DESCENDING)], name="monthly_score"),
+        IndexModel([("total_score", DESCENDING)], name="total_score"),
+    ],
+    "polls": [
+        IndexModel([("category", ASCENDING)], name="category"),
+        IndexModel([("year", ASCENDING), ("month", ASCENDING), ("day", ASCENDING)], name="date"),
+    ],
+    "user_sessions": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("session_id", ASCENDING)], name="session_id"),
+        IndexModel([("deadline", ASCENDING)], name="deadline"),
+    ],
+    "broadcasts": [
+        IndexModel([("status", ASCENDING), ("heartbeat_at", ASCENDING)], name="status_heartbeat"),
+    ],
+    "pending_updates": [
+        IndexModel([("owner", ASCENDING), ("update_id", ASCENDING)], name="owner_update_id"),
+    ],
+}
+
+# Hot query shapes as (collection, filter, sort); each must be served by an index.
+HOT_QUERIES = [
+    ("users", {"user_id": 0}, None),
+    ("users", {"username": ""}, None),
+    ("users", {"daily_score": {"$gt": 0}}, [("daily_score", DESCENDING)]),
+    ("users", {"monthly_score": {"$gt": 0}}, [("monthly_score", DESCENDING)]),
+    ("users", {"total_score": {"$gt": 0}}, [("total_score", DESCENDING)]),
+    ("polls", {"category": ""}, None),
+    ("polls", {"year": 2000, "month": 1, "day": 1}, None),
+    ("user_sessions", {"user_id": 0, "finalized": {"$ne": True}}, None),
+    ("user_sessions", {"user_id": 0, "session_id": ""}, None),
+    ("user_sessions", {"deadline": {"$lte": datetime(2000, 1, 1)}, "finalized": {"$ne": True}}, None),
+    ("broadcasts", {"status": "running", "heartbeat_at": {"$lt": datetime(2000, 1, 1)}}, None),
+    ("pending_updates", {"owner": ""}, [("update_id", ASCENDING)]),
+]
+
+INDEX_CHECK = os.getenv("INDEX_CHECK", "warn")  # "off", "warn" (log collection scans) or "strict" (refuse to start)
+
+async def ensure_indexes():
+    """Create any missing index the bot relies on (existing ones are left untouched)."""
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        existing = {tuple(index["key"].items()) async for index in collection.list_indexes()}
+        missing = [index for index in indexes if tuple(index.document["key"].items()) not in existing]
+        if missing:
+            created = await collection.create_indexes(missing)
+            logging.info(f"Created indexes on {collection_name}: {', '.join(created)}")
+
+def plan_stages(plan: dict):
+    """Yield every stage name in an explain() plan tree."""
+    yield plan.get("stage")
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            yield from plan_stages(plan[child])
+    for stage in plan.get("inputStages", []) + plan.get("shards", []):  # "shards" on a mongos
+        yield from plan_stages(stage.get("winningPlan", stage))
+
+async def verify_query_plans(strict: bool = False):
+    """Explain each hot query shape and report the ones planned as collection scans.
+
+    Returns the offending shapes; with `strict`, raises RuntimeError instead so a
+    missing index is caught before the bot starts serving.
+    """
+    scans = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = set(plan_stages(explanation["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            scans.append((collection_name, query, sort))
+            logging.warning(f"Collection scan for {collection_name} query {query} (sort {sort}); is an index missing?")
+
+    if scans and strict:
+        raise RuntimeError(f"{len(scans)} hot queries are planned as collection scans")
+    return scans
+
+### Webhook Mode ###
+
+class UpdateOffset:
+    """Watermark of handled update IDs, persisted in `bot_state`.
+
+    Telegram numbers updates sequentially, so every ID up to `last_update_id`
+    has been handled. IDs finished out of order wait in `done_ids` until the
+    gap below them closes. Until a watermark is known (first boot, or after
+    the IDs restarted) only `done_ids` is trusted, because parallel
+    deliveries may still bring IDs below the first one seen.
+    """
+
+    MAX_OUT_OF_ORDER = 10000  # A gap older than this is an ID Telegram will never deliver
+
+    def __init__(self, collection, key: str = "updates"):
+        self.collection = collection
+        self.key = key
+        self.last_update_id = None
+        self.done_ids = set()
+        self.saved_update_id = None
+
+    async def load(self):
+        document = await self.collection.find_one({"_id": self.key}, {"last_update_id": 1})
+        if document:
+            self.last_update_id = self.saved_update_id = document["last_update_id"]
+
+    def handled(self, update_id: int) -> bool:
+        """Whether the update was already handled (a redelivery)."""
+        if update_id in self.done_ids:
+            return True
+        if self.last_update_id is None:
+            return False
+        # An ID far below the watermark belongs to a restarted sequence, not to a redelivery.
+        return self.last_update_id - self.MAX_OUT_OF_ORDER < update_id <= self.last_update_id
+
+    def received(self, update_id: int):
+        # After a week without updates Telegram restarts IDs at a random value, higher or lower.
+        if self.last_update_id is not None and abs(update_id - self.last_update_id) > self.MAX_OUT_OF_ORDER:
+            logging.info(f"Update IDs restarted at {update_id} (watermark was {self.last_update_id}).")
+            self.last_update_id = None
+            self.done_ids.clear()
+
+    def complete(self, update_id: int):
+        self.done_ids.add(update_id)
+        if len(self.done_ids) > self.MAX_OUT_OF_ORDER:
+            self.last_update_id = min(self.done_ids) - 1  # Also settles the floor after a first boot or restart
+        if self.last_update_id is None:
+            return
+        while self.last_update_id + 1 in self.done_ids:
+            self.last_update_id += 1
+            self.done_ids.remove(self.last_update_id)
 
+    async def save(self):
+        if self.last_update_id is None or self.last_update_id == self.saved_update_id:
+            return
+        last_update_id = self.last_update_id
+        await self.collection.update_one(
+            {"_id": self.key}, {"$set": {"last_update_id": last_update_id, "updated_at": datetime.now()}}, upsert=True
+        )
+        self.saved_update_id = last_update_id
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(UPDATE_OFFSET_SAVE_INTERVAL)
+            try:
+                await self.save()
+            except PyMongoError as e:
+                logging.error(f"Failed to save update offset: {e}")
+
+
+update_offset = UpdateOffset(db["bot_state"])
+
+
+class UpdateJournal:
+    """Raw updates acknowledged to their sender but not yet finished, in `pending_updates`.
+
+    Each receiver (the webhook server, a worker, the polling front) journals
+    under its own `owner`, acknowledges, and removes the record once it is
+    done with the update. After a restart it replays what is left, so an
+    update is never lost between being acknowledged and being handled.
+    """
+
+    def __init__(self, collection, owner: str):
+        self.collection = collection
+        self.owner = owner
+
+    async def add(self, updates: list[dict]):
+        """Record raw updates; ones already recorded are left as they are."""
+        if not updates:
+            return
+        try:
+            await self.collection.insert_many([
+                {"_id": f"{self.owner}:{data['update_id']}", "owner": self.owner,
+                 "update_id": data["update_id"], "data": data, "received_at": datetime.now()}
+                for data in updates
+            ], ordered=False)
+        except BulkWriteError as e:
+            if e.details.get("writeConcernErrors") or any(
+                error["code"] != 11000 for error in e.details["writeErrors"]  # 11000: already recorded
+            ):
+                raise
+
+    async def remove(self, update_id: int):
+        await self.collection.delete_one({"_id": f"{self.owner}:{update_id}"})
+
+    async def pending(self) -> list[dict]:
+        """The raw updates left unfinished by an earlier run, oldest first."""
+        cursor = self.collection.find({"owner": self.owner}, {"data": 1}).sort("update_id", ASCENDING)
+        return [document["data"] async for document in cursor]
+
+
+class WebhookServer:
+    """aiohttp webhook endpoint feeding bounded per-user queues drained by a worker pool.
+
+    Updates wait in one queue per user, and a worker takes a whole user's
+    queue, handling it in arrival order. Updates from a user whose earlier
+    update is still running therefore wait without holding a worker, and
+    other users keep the remaining workers. An update is acknowledged as soon
+    as it is recorded in `journal` and queued, so Telegram's max_connections
+    does not cap throughput; updates still queued or running when the bot
+    stops are replayed from the journal on the next start. More than
+    `queue_size` queued updates are answered with 429 and a stopping server
+    with 503; Telegram retries both later. Redeliveries of updates already
+    accepted are acknowledged without queueing them again.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, offset: UpdateOffset | None, journal: UpdateJournal,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                 queue_size: int = UPDATE_QUEUE_SIZE, workers: int = UPDATE_WORKERS):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.offset = offset  # None in worker processes: the front process tracks offsets
+        self.journal = journal
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.queued = 0  # Updates accepted but not yet picked up by a worker
+        self.user_updates = {}  # user key -> deque of (update, recorded), while queued or being handled
+        self.ready = asyncio.Queue()  # User keys with updates and no worker on them yet
+        self.workers = workers
+        self.pending = set()  # IDs of updates accepted and not yet handled
+        self.accepting = False
+        self.tasks = []
+        self.runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post(WEBHOOK_PATH, self.handle)
+
+    def enqueue(self, data: dict, update: types.Update, recorded: asyncio.Future):
+        """Queue an update behind its user's earlier ones; `recorded` resolves once it is journaled."""
+        user_id = update_user_id(data)
+        key = user_id if user_id is not None else ("update", update.update_id)  # Userless updates run alone
+        updates = self.user_updates.get(key)
+        if updates is None:
+            updates = self.user_updates[key] = deque()
+            self.ready.put_nowait(key)
+        updates.append((update, recorded))
+        self.queued += 1
+        self.pending.add(update.update_id)
+        if self.offset:
+            self.offset.received(update.update_id)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        if not self.accepting:
+            return web.Response(status=503, headers={"Retry-After": "5"})
+
+        try:
+            data = await request.json()
+            update = types.Update.model_validate(data, context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        if update.update_id in self.pending or (self.offset and self.offset.handled(update.update_id)):
+            return web.Response()
+        if self.queued >= self.queue_size:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+
+        # Queued before the journal write, so the user's updates keep their arrival order.
+        recorded = asyncio.ensure_future(self.journal.add([data]))
+        self.enqueue(data, update, recorded)
+        try:
+            await asyncio.shield(recorded)  # A dropped connection must not cancel the write
+        except PyMongoError as e:
+            logging.error(f"Failed to journal update {update.update_id}: {e}")
+            return web.Response(status=503, headers={"Retry-After": "1"})  # Handled anyway; the retry is acknowledged
+        return web.Response()
+
+    async def worker(self):
+        while True:
+            key = await self.ready.get()
+            updates = self.user_updates[key]
+            while updates:  # Updates arriving meanwhile join this deque instead of waking another worker
+                update, recorded = updates.popleft()
+                self.queued -= 1
+                try:
+                    await self.dispatcher.feed_update(self.bot, update)
+                except Exception as e:
+                    logging.error(f"Error handling update {update.update_id}: {e}")
+                finally:
+                    if self.offset:
+                        self.offset.complete(update.update_id)
+                    self.pending.discard(update.update_id)
+                await self.forget(update.update_id, recorded)
+            del self.user_updates[key]
+            self.ready.task_done()
+
+    async def forget(self, update_id: int, recorded: asyncio.Future):
+        """Drop a handled update from the journal, once its record has been written."""
+        await asyncio.wait([recorded])
+        if recorded.exception():
+            return  # Never journaled; the write error was already logged
+        try:
+            await self.journal.remove(update_id)
+        except PyMongoError as e:
+            logging.warning(f"Update {update_id} left in the journal and may be handled again: {e}")
+
+    async def start(self):
+        for data in await self.journal.pending():  # Accepted before the last stop but never handled
+            recorded = asyncio.get_running_loop().create_future()
+            recorded.set_result(None)
+            self.enqueue(data, types.Update.model_validate(data, context={"bot": self.bot}), recorded)
+        if self.queued:
+            logging.info(f"Replaying {self.queued} updates from the journal.")
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.accepting = True
+
+    async def stop(self, timeout: float = 30):
+        """Stop accepting updates and let the workers finish the queued ones."""
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self.ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{self.queued} queued updates left unhandled; they are replayed on the next start.")
+        for task in self.tasks:
+            task.cancel()
+        if self.runner:
+            await self.runner.cleanup()
+
+
+async def run_webhook():
+    """Serve updates through the webhook until the bot is stopped."""
+    await update_offset.load()
+    server = WebhookServer(dp, bot, update_offset, UpdateJournal(db["pending_updates"], "webhook"))
+    await server.start()
+    offset_task = asyncio.create_task(update_offset.run())
+
+    # Pending updates are kept, so the backlog from while the bot was down is delivered.
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=False
+    )
+    logging.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
 
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        offset_task.cancel()
+        await update_offset.save()
+
+### Sharded Worker Processes ###
+
+def update_user_id(data: dict) -> int | None:
+    """Return the ID of the user who caused a raw update, if there is one."""
+    for key, event in data.items():
+        if key != "update_id" and isinstance(event, dict):
+            user = event.get("from") or event.get("user")
+            if user:
+                return user["id"]
+    return None
+
+
+class ShardRouter:
+    """Forward raw updates to the worker process that owns their user.
+
+    Users map to workers by `user_id % WORKER_PROCESSES` (the same rule as
+    `shard_filter`), so each worker sees every update of its users and keeps
+    their FSM state, tracked polls and quiz timers in its own memory.
+    """
+
+    def __init__(self, processes: int = WORKER_PROCESSES, base_port: int = WORKER_BASE_PORT):
+        self.urls = [f"http://127.0.0.1:{base_port + index}{WEBHOOK_PATH}" for index in range(processes)]
+        self.headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+        self.session = None
+
+    async def forward(self, data: dict) -> int:
+        """Deliver an update and return the worker's HTTP status (503 if it is unreachable)."""
+        if self.session is None:
+            self.session = ClientSession()
+        user_id = update_user_id(data)
+        url = self.urls[(user_id or 0) % len(self.urls)]
+        try:
+            async with self.session.post(url, json=data, headers=self.headers) as response:
+                return response.status
+        except ClientError as e:
+            logging.warning(f"Worker at {url} unreachable: {e}")
+            return 503
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+
+async def supervise_worker(index: int):
+    """Run worker process `index`, restarting it whenever it exits."""
+    env = {**os.environ, "WORKER_INDEX": str(index), "WORKER_PROCESSES": str(WORKER_PROCESSES)}
+    while True:
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env=env)
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            process.terminate()
+            await process.wait()
+            raise
+        logging.error(f"Worker {index} exited with code {code}; restarting.")
+        await asyncio.sleep(1)
+
+
+async def forward_polled_updates(router: ShardRouter, journal: UpdateJournal):
+    """Long-poll Telegram in the front process and hand updates to the workers.
+
+    Fetched updates are recorded in `journal` before the next getUpdates
+    call confirms them, so polling never waits for deliveries and a slow
+    or unreachable worker holds up only its own users. Each user's updates
+    are chained and reach the worker in update order; an update leaves the
+    journal once its worker has accepted it, and a restarted front replays
+    the rest.
+    """
+    await bot.delete_webhook(drop_pending_updates=False)
+    allowed_updates = dp.resolve_used_update_types()
+    chains = {}  # user key -> that user's latest delivery task
+    offset = None
+
+    async def deliver(data: dict, previous):
+        if previous:
+            await asyncio.wait([previous])  # Keep the user's order; never raises
+        delay = 0.5
+        while await router.forward(data) in (429, 503):
+            await asyncio.sleep(delay)  # Worker busy or restarting
+            delay = min(delay * 2, 10)
+        try:
+            await journal.remove(data["update_id"])
+        except PyMongoError as e:
+            logging.warning(f"Update {data['update_id']} left in the journal and may be delivered again: {e}")
+
+    def dispatch(data: dict):
+        user_id = update_user_id(data)
+        key = user_id if user_id is not None else ("update", data["update_id"])
+        task = asyncio.create_task(deliver(data, chains.get(key)))
+        chains[key] = task
+        task.add_done_callback(lambda task: chains.pop(key) if chains.get(key) is task else None)
+
+    for data in await journal.pending():  # Fetched before the last stop but never accepted by a worker
+        dispatch(data)
+
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+            batch = [update.model_dump(mode="json", by_alias=True, exclude_none=True) for update in updates]
+            await journal.add(batch)  # Before the offset moves past them
+        except Exception as e:
+            logging.error(f"Error fetching updates: {e}")
+            await asyncio.sleep(1)
+            continue
+        for data in batch:
+            dispatch(data)
+            offset = data["update_id"] + 1
+
+
+async def run_front():
+    """Receive updates (polling or webhook) and shard them across worker processes."""
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)  # Stop the workers too
+    supervisors = [asyncio.create_task(supervise_worker(index)) for index in range(WORKER_PROCESSES)]
+    router = ShardRouter()
+    runner = None
+    try:
+        if BOT_MODE == "webhook":
+            await update_offset.load()
+            offset_task = asyncio.create_task(update_offset.run())
+
+            async def handle(request: web.Request) -> web.Response:
+                if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+                    return web.Response(status=401)
+                try:
+                    data = await request.json()
+                    update_id = data["update_id"]
+                except (ValueError, KeyError, TypeError):
+                    return web.Response(status=400)
+                if update_offset.handled(update_id):
+                    return web.Response()
+                update_offset.received(update_id)
+                status = await router.forward(data)
+                if status == 200:
+                    update_offset.complete(update_id)
+                headers = {"Retry-After": "1"} if status in (429, 503) else None
+                return web.Response(status=status, headers=headers)
+
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            await bot.set_webhook(
+                WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False
+            )
+            try:
+                await asyncio.Event().wait()
+            finally:
+                offset_task.cancel()
+                await update_offset.save()
+        else:
+            await forward_polled_updates(router, UpdateJournal(db["pending_updates"], "front"))
+    finally:
+        if runner:
+            await runner.cleanup()
+        await router.close()
+        for supervisor in supervisors:
+            supervisor.cancel()
+        await asyncio.gather(*supervisors, return_exceptions=True)
+
+
+async def run_worker():
+    """Serve the updates the front process forwards to this worker."""
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    journal = UpdateJournal(db["pending_updates"], f"worker-{WORKER_INDEX}")
+    server = WebhookServer(dp, bot, None, journal, host="127.0.0.1", port=WORKER_BASE_PORT + WORKER_INDEX)
+    await server.start()
+    logging.info(f"Worker {WORKER_INDEX}/{WORKER_PROCESSES} listening on port {server.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
 
 async def main():
     """Main entry point of the bot."""
-    await set_bot_commands()
+    if WORKER_PROCESSES > 1 and WORKER_INDEX is None:
+        await run_front()  # Handlers run in the worker processes
+        return
+
+    # Bot-wide setup and jobs run once: in the only process, or in worker 0.
+    primary = WORKER_INDEX in (None, 0)
+    if primary:
+        await set_bot_commands()
+        await ensure_indexes()
+        if INDEX_CHECK != "off":
+            await verify_query_plans(strict=INDEX_CHECK == "strict")
+        if isinstance(fsm_storage, MongoStorage):
+            await fsm_storage.ensure_indexes()
+        await quotas_collection.create_index("expires_at", expireAfterSeconds=0)  # Drop stale quota buckets
+        asyncio.create_task(resume_broadcasts())  # Continue broadcasts interrupted by a restart
+    if METRICS_PORT:
+        await metrics.serve(METRICS_PORT + (WORKER_INDEX or 0))  # One port per worker process
     asyncio.create_task(schedule_resets())  # Start reset scheduling
+    asyncio.create_task(question_bank.run())  # Preload and sync the question bank cache
+    asyncio.create_task(poll_tracker.run())  # Persist tracked polls in batches
+    asyncio.create_task(leaderboards.run())  # Build the in-memory leaderboards
+    if session_buffer:
+        await session_buffer.replay()  # Recover answers buffered before a crash
+        asyncio.create_task(session_buffer.run())
+    asyncio.create_task(quiz_timeouts.run())  # Expire unfinished quizzes, including ones from before a restart
 
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        if WORKER_INDEX is not None:
+            await run_worker()
+        elif BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await dp.start_polling(bot, skip_updates=True)
     except Exception as e:
         logging.error(f"Error during polling: {e}")
+    finally:
+        await poll_tracker.flush()  # Don't lose polls sent just before shutdown
+        if session_buffer:
+            await session_buffer.flush()
 
 if __name__ == "__main__":
     asyncio.run(main())